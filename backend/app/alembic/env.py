@@ -23,8 +23,15 @@ from app.models_mri import SQLModel # noqa
 from app.models_crr import SQLModel # noqa
 from app.core.config import settings # noqa
 
+from app.core.partitions import is_partition # noqa
+
 target_metadata = SQLModel.metadata
 
+
+def include_name(name, type_, parent_names):
+    # Partitions are created at runtime, they are not part of the metadata
+    return not (type_ == "table" and is_partition(name))
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -49,7 +56,8 @@ def run_migrations_offline():
     """
     url = get_url()
     context.configure(
-        url=url, target_metadata=target_metadata, literal_binds=True, compare_type=True
+        url=url, target_metadata=target_metadata, literal_binds=True, compare_type=True,
+        include_name=include_name,
     )
 
     with context.begin_transaction():
@@ -73,7 +81,8 @@ def run_migrations_online():
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata, compare_type=True
+            connection=connection, target_metadata=target_metadata, compare_type=True,
+            include_name=include_name,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,75 @@
+"""Add crr_latest_prices maintained by triggers on the price tables
+
+Revision ID: 0b6e4d2a9c13
+Revises: f29b6c0d4e81
+Create Date: 2026-10-17 19:02:41.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b6e4d2a9c13'
+down_revision = 'f29b6c0d4e81'
+branch_labels = None
+depends_on = None
+
+PRICE_TABLES = (('cds_prices', 'cds'), ('crr_prices', 'crr'))
+
+
+def upgrade():
+    op.create_table('crr_latest_prices',
+    sa.Column('security_id', sa.Uuid(), nullable=False),
+    sa.Column('cds_price', sa.Float(), nullable=True),
+    sa.Column('cds_date', sa.DateTime(), nullable=True),
+    sa.Column('crr_price', sa.Float(), nullable=True),
+    sa.Column('crr_date', sa.DateTime(), nullable=True),
+    sa.Column('spread', sa.Float(), sa.Computed(
+        "CASE WHEN cds_price <> 0 AND crr_price <> 0 "
+        "THEN round((cds_price - crr_price)::numeric, 2)::double precision END"
+    ), nullable=True),
+    sa.ForeignKeyConstraint(['security_id'], ['crr_securities.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('security_id')
+    )
+    for table, prefix in PRICE_TABLES:
+        op.execute(f"""
+            CREATE OR REPLACE FUNCTION crr_latest_prices_{prefix}() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    UPDATE crr_latest_prices SET ({prefix}_price, {prefix}_date) = (
+                        SELECT price, entry_date FROM {table}
+                        WHERE security_id = OLD.security_id ORDER BY entry_date DESC LIMIT 1
+                    )
+                    WHERE security_id = OLD.security_id;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO crr_latest_prices (security_id, {prefix}_price, {prefix}_date)
+                    VALUES (NEW.security_id, NEW.price, NEW.entry_date)
+                    ON CONFLICT (security_id) DO UPDATE
+                    SET {prefix}_price = EXCLUDED.{prefix}_price, {prefix}_date = EXCLUDED.{prefix}_date
+                    WHERE crr_latest_prices.{prefix}_date IS NULL
+                       OR crr_latest_prices.{prefix}_date <= EXCLUDED.{prefix}_date;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {table}_latest_price AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION crr_latest_prices_{prefix}()
+        """)
+        op.execute(f"""
+            INSERT INTO crr_latest_prices (security_id, {prefix}_price, {prefix}_date)
+            SELECT DISTINCT ON (security_id) security_id, price, entry_date
+            FROM {table} ORDER BY security_id, entry_date DESC
+            ON CONFLICT (security_id) DO UPDATE
+            SET {prefix}_price = EXCLUDED.{prefix}_price, {prefix}_date = EXCLUDED.{prefix}_date
+        """)
+
+
+def downgrade():
+    for table, prefix in PRICE_TABLES:
+        op.execute(f"DROP TRIGGER {table}_latest_price ON {table}")
+        op.execute(f"DROP FUNCTION crr_latest_prices_{prefix}()")
+    op.drop_table('crr_latest_prices')
@@ -0,0 +1,41 @@
+"""Add materialized MRI portfolio series
+
+Revision ID: 5b7e2f4c9a10
+Revises: 64f9b1d61e03
+Create Date: 2026-10-17 09:12:40.118230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e2f4c9a10'
+down_revision = '64f9b1d61e03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('mri_portfolio_series',
+    sa.Column('portfolio_id', sa.Uuid(), nullable=False),
+    sa.Column('lookback', sa.Integer(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.Column('value', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['portfolio_id'], ['mri_portfolios.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('portfolio_id', 'lookback', 'date')
+    )
+
+    # Backfill the series of every existing portfolio
+    op.execute("""
+        INSERT INTO mri_portfolio_series (portfolio_id, lookback, date, value)
+        SELECT c.portfolio_id, o.lookback, o.date, SUM(o.rpr * c.weight)
+        FROM mri_asset_outputs o
+        JOIN mri_portfolio_constituents c
+          ON o.asset_class = c.asset_class AND o.domain = c.asset_domain
+        GROUP BY c.portfolio_id, o.lookback, o.date
+    """)
+
+
+def downgrade():
+    op.drop_table('mri_portfolio_series')
@@ -0,0 +1,35 @@
+"""Add unique (security_id, entry_date) covering indexes on cds_prices and crr_prices
+
+Revision ID: 7e3f1a8b5d20
+Revises: 0b6e4d2a9c13
+Create Date: 2026-10-17 19:41:12.864027
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7e3f1a8b5d20'
+down_revision = '0b6e4d2a9c13'
+branch_labels = None
+depends_on = None
+
+PRICE_TABLES = ('cds_prices', 'crr_prices')
+
+
+def upgrade():
+    for table in PRICE_TABLES:
+        # Keep a single price per security and date before enforcing it
+        op.execute(f"""
+            DELETE FROM {table} duplicate USING {table} kept
+            WHERE duplicate.security_id = kept.security_id
+              AND duplicate.entry_date = kept.entry_date
+              AND duplicate.id < kept.id
+        """)
+        op.create_index(f'ix_{table}_security_id_entry_date', table, ['security_id', 'entry_date'],
+                        unique=True, postgresql_include=['price'])
+
+
+def downgrade():
+    for table in PRICE_TABLES:
+        op.drop_index(f'ix_{table}_security_id_entry_date', table_name=table)
@@ -0,0 +1,50 @@
+"""Add covering natural-key index on mri_asset_outputs
+
+Revision ID: 8d41c6a2e9f3
+Revises: 5b7e2f4c9a10
+Create Date: 2026-10-17 10:03:12.504771
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41c6a2e9f3'
+down_revision = '5b7e2f4c9a10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Re-running the seeder used to insert the same rows again, keep one copy
+    op.execute("""
+        DELETE FROM mri_asset_outputs a
+        USING mri_asset_outputs b
+        WHERE a.asset_class = b.asset_class
+          AND a.domain = b.domain
+          AND a.lookback = b.lookback
+          AND a.date = b.date
+          AND a.id > b.id
+    """)
+    op.create_index(
+        'ix_mri_asset_outputs_asset_class_domain_lookback_date',
+        'mri_asset_outputs',
+        ['asset_class', 'domain', 'lookback', 'date'],
+        unique=True,
+        postgresql_include=['rpr'],
+    )
+
+    # Duplicates were summed twice into the materialized series, rebuild it
+    op.execute("DELETE FROM mri_portfolio_series")
+    op.execute("""
+        INSERT INTO mri_portfolio_series (portfolio_id, lookback, date, value)
+        SELECT c.portfolio_id, o.lookback, o.date, SUM(o.rpr * c.weight)
+        FROM mri_asset_outputs o
+        JOIN mri_portfolio_constituents c
+          ON o.asset_class = c.asset_class AND o.domain = c.asset_domain
+        GROUP BY c.portfolio_id, o.lookback, o.date
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_mri_asset_outputs_asset_class_domain_lookback_date', table_name='mri_asset_outputs')
@@ -0,0 +1,31 @@
+"""Add MRI portfolio and dataset versions
+
+Revision ID: a3c9e51d7b26
+Revises: 8d41c6a2e9f3
+Create Date: 2026-10-17 11:26:05.381942
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c9e51d7b26'
+down_revision = '8d41c6a2e9f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('mri_portfolios', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+    op.create_table('mri_dataset_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("INSERT INTO mri_dataset_version (id, version) VALUES (1, 1)")
+
+
+def downgrade():
+    op.drop_table('mri_dataset_version')
+    op.drop_column('mri_portfolios', 'version')
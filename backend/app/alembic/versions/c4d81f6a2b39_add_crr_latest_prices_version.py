@@ -0,0 +1,74 @@
+"""Add a version to crr_latest_prices bumped by the price table triggers
+
+Revision ID: c4d81f6a2b39
+Revises: 7e3f1a8b5d20
+Create Date: 2026-10-17 21:14:37.602815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d81f6a2b39'
+down_revision = '7e3f1a8b5d20'
+branch_labels = None
+depends_on = None
+
+PRICE_TABLES = (('cds_prices', 'cds'), ('crr_prices', 'crr'))
+
+
+def upgrade():
+    op.add_column('crr_latest_prices', sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+    for table, prefix in PRICE_TABLES:
+        newer = f"crr_latest_prices.{prefix}_date IS NULL OR crr_latest_prices.{prefix}_date <= EXCLUDED.{prefix}_date"
+        op.execute(f"""
+            CREATE OR REPLACE FUNCTION crr_latest_prices_{prefix}() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    UPDATE crr_latest_prices SET ({prefix}_price, {prefix}_date) = (
+                        SELECT price, entry_date FROM {table}
+                        WHERE security_id = OLD.security_id ORDER BY entry_date DESC LIMIT 1
+                    ), version = version + 1
+                    WHERE security_id = OLD.security_id;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO crr_latest_prices (security_id, {prefix}_price, {prefix}_date, version)
+                    VALUES (NEW.security_id, NEW.price, NEW.entry_date, 1)
+                    ON CONFLICT (security_id) DO UPDATE
+                    SET {prefix}_price = CASE WHEN {newer} THEN EXCLUDED.{prefix}_price ELSE crr_latest_prices.{prefix}_price END,
+                        {prefix}_date = CASE WHEN {newer} THEN EXCLUDED.{prefix}_date ELSE crr_latest_prices.{prefix}_date END,
+                        version = crr_latest_prices.version + 1;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+    op.alter_column('crr_latest_prices', 'version', server_default=None)
+
+
+def downgrade():
+    for table, prefix in PRICE_TABLES:
+        op.execute(f"""
+            CREATE OR REPLACE FUNCTION crr_latest_prices_{prefix}() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    UPDATE crr_latest_prices SET ({prefix}_price, {prefix}_date) = (
+                        SELECT price, entry_date FROM {table}
+                        WHERE security_id = OLD.security_id ORDER BY entry_date DESC LIMIT 1
+                    )
+                    WHERE security_id = OLD.security_id;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO crr_latest_prices (security_id, {prefix}_price, {prefix}_date)
+                    VALUES (NEW.security_id, NEW.price, NEW.entry_date)
+                    ON CONFLICT (security_id) DO UPDATE
+                    SET {prefix}_price = EXCLUDED.{prefix}_price, {prefix}_date = EXCLUDED.{prefix}_date
+                    WHERE crr_latest_prices.{prefix}_date IS NULL
+                       OR crr_latest_prices.{prefix}_date <= EXCLUDED.{prefix}_date;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+    op.drop_column('crr_latest_prices', 'version')
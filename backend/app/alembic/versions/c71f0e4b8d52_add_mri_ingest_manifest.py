@@ -0,0 +1,32 @@
+"""Add MRI ingest manifest
+
+Revision ID: c71f0e4b8d52
+Revises: a3c9e51d7b26
+Create Date: 2026-10-17 14:02:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71f0e4b8d52'
+down_revision = 'a3c9e51d7b26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('mri_ingest_manifest',
+    sa.Column('file_path', sqlmodel.sql.sqltypes.AutoString(length=1024), nullable=False),
+    sa.Column('checksum', sqlmodel.sql.sqltypes.AutoString(length=64), nullable=False),
+    sa.Column('max_date', sa.DateTime(), nullable=False),
+    sa.Column('rows', sa.Integer(), nullable=False),
+    sa.Column('ingested_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('file_path')
+    )
+
+
+def downgrade():
+    op.drop_table('mri_ingest_manifest')
@@ -0,0 +1,92 @@
+"""Dictionary-encode mri_asset_outputs against an mri_assets catalog
+
+Revision ID: e5a8d3f17c40
+Revises: c71f0e4b8d52
+Create Date: 2026-10-17 15:11:48.902317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a8d3f17c40'
+down_revision = 'c71f0e4b8d52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('mri_assets',
+    sa.Column('id', sa.SmallInteger(), nullable=False),
+    sa.Column('asset_class', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+    sa.Column('domain', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('asset_class', 'domain')
+    )
+    op.execute("""
+        INSERT INTO mri_assets (asset_class, domain)
+        SELECT DISTINCT asset_class, domain FROM mri_asset_outputs ORDER BY asset_class, domain
+    """)
+
+    op.rename_table('mri_asset_outputs', 'mri_asset_outputs_old')
+    op.create_table('mri_asset_outputs',
+    sa.Column('asset_id', sa.SmallInteger(), nullable=False),
+    sa.Column('lookback', sa.SmallInteger(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('rpr', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['asset_id'], ['mri_assets.id'], ),
+    )
+    # Timestamps collapse to days, keep the latest output of a day
+    op.execute("""
+        INSERT INTO mri_asset_outputs (asset_id, lookback, date, rpr)
+        SELECT DISTINCT ON (a.id, o.lookback, o.date::date) a.id, o.lookback, o.date::date, o.rpr
+        FROM mri_asset_outputs_old o
+        JOIN mri_assets a ON a.asset_class = o.asset_class AND a.domain = o.domain
+        ORDER BY a.id, o.lookback, o.date::date, o.date DESC
+    """)
+    # Built after the load; SQLAlchemy cannot emit INCLUDE on a primary key
+    op.execute("""
+        ALTER TABLE mri_asset_outputs
+        ADD CONSTRAINT mri_asset_outputs_pkey PRIMARY KEY (asset_id, lookback, date) INCLUDE (rpr)
+    """)
+    op.drop_table('mri_asset_outputs_old')
+
+    op.execute("DELETE FROM mri_portfolio_series")
+    op.execute("""
+        INSERT INTO mri_portfolio_series (portfolio_id, lookback, date, value)
+        SELECT c.portfolio_id, o.lookback, o.date, SUM(o.rpr * c.weight)
+        FROM mri_portfolio_constituents c
+        JOIN mri_assets a ON a.asset_class = c.asset_class AND a.domain = c.asset_domain
+        JOIN mri_asset_outputs o ON o.asset_id = a.id
+        GROUP BY c.portfolio_id, o.lookback, o.date
+    """)
+
+
+def downgrade():
+    op.rename_table('mri_asset_outputs', 'mri_asset_outputs_new')
+    op.create_table('mri_asset_outputs',
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.Column('domain', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+    sa.Column('asset_class', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+    sa.Column('rpr', sa.Float(), nullable=False),
+    sa.Column('lookback', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("""
+        INSERT INTO mri_asset_outputs (id, date, domain, asset_class, rpr, lookback)
+        SELECT gen_random_uuid(), o.date, a.domain, a.asset_class, o.rpr, o.lookback
+        FROM mri_asset_outputs_new o
+        JOIN mri_assets a ON a.id = o.asset_id
+    """)
+    op.create_index(
+        'ix_mri_asset_outputs_asset_class_domain_lookback_date',
+        'mri_asset_outputs',
+        ['asset_class', 'domain', 'lookback', 'date'],
+        unique=True,
+        postgresql_include=['rpr'],
+    )
+    op.drop_table('mri_asset_outputs_new')
+    op.drop_table('mri_assets')
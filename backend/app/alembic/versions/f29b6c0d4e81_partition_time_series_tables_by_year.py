@@ -0,0 +1,122 @@
+"""Partition mri_asset_outputs, cds_prices and crr_prices by year
+
+Revision ID: f29b6c0d4e81
+Revises: e5a8d3f17c40
+Create Date: 2026-10-17 16:24:09.117350
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f29b6c0d4e81'
+down_revision = 'e5a8d3f17c40'
+branch_labels = None
+depends_on = None
+
+
+def create_partitions(table, column, source):
+    """
+    DEFAULT partition plus one partition per year present in `source`, the
+    current and the next year. Later years are added by ensure_partitions.
+    """
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+    op.execute(f"""
+        DO $$
+        DECLARE year int;
+        BEGIN
+            FOR year IN
+                SELECT DISTINCT extract(year FROM {column})::int FROM {source}
+                UNION SELECT extract(year FROM now())::int
+                UNION SELECT extract(year FROM now())::int + 1
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE {table}_y%s PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+                    year, make_date(year, 1, 1), make_date(year + 1, 1, 1)
+                );
+            END LOOP;
+        END $$
+    """)
+
+
+def create_price_table(table, **kw):
+    op.create_table(table,
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('security_id', sa.Uuid(), nullable=False),
+    sa.Column('entry_date', sa.DateTime(), nullable=False),
+    sa.Column('price', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['security_id'], ['crr_securities.id'], ),
+    **kw
+    )
+
+
+def upgrade():
+    op.rename_table('mri_asset_outputs', 'mri_asset_outputs_old')
+    op.execute("ALTER TABLE mri_asset_outputs_old RENAME CONSTRAINT mri_asset_outputs_pkey TO mri_asset_outputs_old_pkey")
+    op.create_table('mri_asset_outputs',
+    sa.Column('asset_id', sa.SmallInteger(), nullable=False),
+    sa.Column('lookback', sa.SmallInteger(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('rpr', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['asset_id'], ['mri_assets.id'], ),
+    postgresql_partition_by='RANGE (date)'
+    )
+    create_partitions('mri_asset_outputs', 'date', 'mri_asset_outputs_old')
+    op.execute("""
+        INSERT INTO mri_asset_outputs (asset_id, lookback, date, rpr)
+        SELECT asset_id, lookback, date, rpr FROM mri_asset_outputs_old
+    """)
+    op.execute("""
+        ALTER TABLE mri_asset_outputs
+        ADD CONSTRAINT mri_asset_outputs_pkey PRIMARY KEY (asset_id, lookback, date) INCLUDE (rpr)
+    """)
+    op.drop_table('mri_asset_outputs_old')
+
+    for table in ('cds_prices', 'crr_prices'):
+        op.rename_table(table, f'{table}_old')
+        op.execute(f"ALTER TABLE {table}_old RENAME CONSTRAINT {table}_pkey TO {table}_old_pkey")
+        # The partition key has to be part of the primary key
+        create_price_table(table, postgresql_partition_by='RANGE (entry_date)')
+        create_partitions(table, 'entry_date', f'{table}_old')
+        op.execute(f"""
+            INSERT INTO {table} (id, security_id, entry_date, price)
+            SELECT id, security_id, entry_date, price FROM {table}_old
+        """)
+        op.create_primary_key(f'{table}_pkey', table, ['id', 'entry_date'])
+        op.drop_table(f'{table}_old')
+
+
+def downgrade():
+    for table in ('cds_prices', 'crr_prices'):
+        op.rename_table(table, f'{table}_partitioned')
+        op.execute(f"ALTER TABLE {table}_partitioned RENAME CONSTRAINT {table}_pkey TO {table}_partitioned_pkey")
+        create_price_table(table)
+        op.execute(f"""
+            INSERT INTO {table} (id, security_id, entry_date, price)
+            SELECT id, security_id, entry_date, price FROM {table}_partitioned
+        """)
+        op.create_primary_key(f'{table}_pkey', table, ['id'])
+        op.drop_table(f'{table}_partitioned')
+
+    op.rename_table('mri_asset_outputs', 'mri_asset_outputs_partitioned')
+    op.execute(
+        "ALTER TABLE mri_asset_outputs_partitioned "
+        "RENAME CONSTRAINT mri_asset_outputs_pkey TO mri_asset_outputs_partitioned_pkey"
+    )
+    op.create_table('mri_asset_outputs',
+    sa.Column('asset_id', sa.SmallInteger(), nullable=False),
+    sa.Column('lookback', sa.SmallInteger(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('rpr', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['asset_id'], ['mri_assets.id'], ),
+    )
+    op.execute("""
+        INSERT INTO mri_asset_outputs (asset_id, lookback, date, rpr)
+        SELECT asset_id, lookback, date, rpr FROM mri_asset_outputs_partitioned
+    """)
+    op.execute("""
+        ALTER TABLE mri_asset_outputs
+        ADD CONSTRAINT mri_asset_outputs_pkey PRIMARY KEY (asset_id, lookback, date) INCLUDE (rpr)
+    """)
+    op.drop_table('mri_asset_outputs_partitioned')
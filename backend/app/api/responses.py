@@ -0,0 +1,132 @@
+import hashlib
+import json
+from collections.abc import Iterable
+from typing import Any
+
+import msgpack  # type: ignore
+import numpy as np
+import pyarrow as pa  # type: ignore
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+MSGPACK = "application/msgpack"
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+
+BINARY_MEDIA_TYPES = (ARROW_STREAM, MSGPACK)
+# Time series endpoints can also stream
+SERIES_MEDIA_TYPES = (*BINARY_MEDIA_TYPES, NDJSON)
+
+# Lines written per chunk of a streamed response
+NDJSON_CHUNK_LINES = 1000
+
+# Responses are per user and must be revalidated, which a 304 makes cheap
+CACHE_CONTROL = "private, no-cache"
+
+
+def negotiate_media_type(request: Request, supported: tuple[str, ...] = BINARY_MEDIA_TYPES) -> str:
+    """
+    Pick the response media type from the Accept header. JSON is the default
+    and wins ties, other types are only used when explicitly requested.
+    """
+    best, best_quality = JSON, 0.0
+    for entry in request.headers.get("accept", "").split(","):
+        media_type, *params = (part.strip() for part in entry.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type in (JSON, "application/*", "*/*"):
+            media_type = JSON
+        elif media_type not in supported:
+            continue
+        if quality > best_quality or (quality == best_quality and media_type == JSON):
+            best, best_quality = media_type, quality
+    return best
+
+
+def nan_to_none(column: np.ndarray) -> list[Any]:
+    """
+    Values of a column as a list with NaN as None, the JSON null.
+    """
+    values: list[Any] = column.tolist()
+    if column.dtype.kind == "f":
+        for i in np.flatnonzero(np.isnan(column)).tolist():
+            values[i] = None
+    return values
+
+
+def columnar_response(
+    media_type: str, columns: dict[str, np.ndarray], metadata: dict[str, Any] | None = None
+) -> Response:
+    """
+    Encode equally long column arrays as an Arrow IPC stream (one record
+    batch, metadata in the schema) or a MessagePack map of column lists.
+    NaN values become nulls.
+    """
+    if media_type == ARROW_STREAM:
+        table = pa.table(
+            {name: pa.array(column, from_pandas=True) for name, column in columns.items()},
+            metadata={key: json.dumps(value) for key, value in (metadata or {}).items()},
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        content = sink.getvalue().to_pybytes()
+    elif media_type == MSGPACK:
+        payload: dict[str, Any] = {name: nan_to_none(column) for name, column in columns.items()}
+        if metadata:
+            payload["metadata"] = metadata
+        content = msgpack.packb(payload)
+    else:
+        raise ValueError(f"Unsupported media type {media_type}")
+    return Response(content=content, media_type=media_type, headers={"Vary": "Accept"})
+
+
+def ndjson_response(lines: Iterable[Any], headers: dict[str, str] | None = None) -> StreamingResponse:
+    """
+    Stream one JSON document per line, as `lines` yields them. Lines are
+    sent in chunks of NDJSON_CHUNK_LINES to keep writes reasonably large.
+    """
+    def encode() -> Iterable[bytes]:
+        chunk = []
+        for line in lines:
+            chunk.append(json.dumps(line, separators=(",", ":")))
+            if len(chunk) == NDJSON_CHUNK_LINES:
+                yield ("\n".join(chunk) + "\n").encode()
+                chunk = []
+        if chunk:
+            yield ("\n".join(chunk) + "\n").encode()
+
+    return StreamingResponse(encode(), media_type=NDJSON, headers={"Vary": "Accept", **(headers or {})})
+
+
+def entity_tag(*parts: Any) -> str:
+    """
+    Strong ETag of a representation, derived from everything it was built
+    from: data versions, query parameters and the negotiated media type.
+    """
+    return '"' + hashlib.sha256(repr(parts).encode()).hexdigest()[:32] + '"'
+
+
+def cache_headers(etag: str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept"}
+
+
+def not_modified(request: Request, etag: str) -> Response | None:
+    """
+    304 response when the If-None-Match header matches `etag`, compared
+    weakly as GET requests allow.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return None
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if "*" in tags or etag in tags:
+        return Response(status_code=304, headers=cache_headers(etag))
+    return None
@@ -1,45 +1,130 @@
 import uuid
-from datetime import timedelta, datetime
-from typing import List
-from typing import Optional
+from collections.abc import Iterator
+from datetime import datetime
+from typing import Annotated, Any, List
 
+import numpy as np
 import pandas as pd
-from fastapi import APIRouter
+from fastapi import APIRouter, Query, Request, Response
+from sqlalchemy import ColumnElement, Float, and_, cast, func, text
 from sqlmodel import Session
 from sqlmodel import select
 
 from app.api.deps import SessionDep, CurrentUser
+from app.api.responses import (
+    JSON,
+    NDJSON,
+    SERIES_MEDIA_TYPES,
+    cache_headers,
+    columnar_response,
+    entity_tag,
+    ndjson_response,
+    negotiate_media_type,
+    not_modified,
+)
+from app.core.config import settings
+from app.core.db import engine
+from app.timeseries import closed_runs, epoch_seconds
 from app.models_crr import SecurityResponseCRR, CRRPortfolioConstituent, SpreadRegion, \
     SpreadAnalysisResponse, SecurityDataResponse, CRRPrice, SecurityResponseMerton, MertonDataResponse, CRRMerton, \
-    CDSPrice, CRRSecurity, AddSecurityRequest
+    CDSPrice, CRRSecurity, AddSecurityRequest, CRRLatestPrice
 
 router = APIRouter()
 
 
+def _epoch(column: Any) -> ColumnElement[float]:
+    """
+    Epoch seconds of a timestamp column, read as UTC like epoch_seconds.
+    """
+    return cast(func.extract("epoch", column), Float)
+
+
+def _price_columns(sess: Session, model: type[CDSPrice] | type[CRRPrice], security_id: uuid.UUID) -> np.ndarray:
+    """
+    (epoch seconds, price) rows of a price history as one float array, missing prices as NaN.
+    """
+    return np.array(sess.exec(
+        select(_epoch(model.entry_date), model.price)
+        .where(model.security_id == security_id)
+        .order_by(model.entry_date)
+    ).all(), dtype=np.float64).reshape(-1, 2)
+
+
+def _price_history_version(sess: Session, security_id: uuid.UUID) -> int:
+    """
+    Version of both price histories of a security, bumped by the price table
+    triggers on every insert, update and delete. 0 before its first price.
+    """
+    version = sess.exec(
+        select(CRRLatestPrice.version).where(CRRLatestPrice.security_id == security_id)
+    ).first()
+    return version or 0
+
+
+# Rows fetched per round trip when a price history is streamed
+PRICE_STREAM_BATCH_SIZE = 5000
+
+
+def _stream_prices(security_id: uuid.UUID) -> Iterator[dict[str, Any]]:
+    """
+    CRR prices with the CDS price of the same date, one row at a time off a
+    server-side cursor, in the columns and UTC epoch dates of the binary
+    formats.
+    """
+    # The request session is closed before a streamed body is sent
+    with Session(engine) as sess:
+        rows = sess.exec(
+            select(_epoch(CRRPrice.entry_date), CRRPrice.price, CDSPrice.price)
+            .outerjoin(CDSPrice, and_(
+                CDSPrice.security_id == CRRPrice.security_id, CDSPrice.entry_date == CRRPrice.entry_date
+            ))
+            .where(CRRPrice.security_id == security_id)
+            .order_by(CRRPrice.entry_date)
+            .execution_options(yield_per=PRICE_STREAM_BATCH_SIZE)
+        )
+        for date, crr, cds in rows:
+            yield {"date": int(date), "crr": crr, "cds": cds}
+
+
+def _align(dates: np.ndarray, other_dates: np.ndarray, other_values: np.ndarray) -> np.ndarray:
+    """
+    Values of another series on the sorted `dates`, NaN where it has no entry.
+    """
+    aligned = np.full(len(dates), np.nan)
+    if len(dates):
+        positions = np.minimum(np.searchsorted(dates, other_dates), len(dates) - 1)
+        found = dates[positions] == other_dates
+        aligned[positions[found]] = other_values[found]
+    return aligned
+
+
+def portfolio_statement(user_id: uuid.UUID) -> Any:
+    """
+    (constituent, ticker, latest CDS price, latest CRR price, spread) of
+    every security in a user's portfolio, read off crr_latest_prices.
+    """
+    return (
+        select(
+            CRRPortfolioConstituent,
+            CRRSecurity.ticker_bbg,
+            CRRLatestPrice.cds_price,
+            CRRLatestPrice.crr_price,
+            CRRLatestPrice.spread,
+        )
+        .join(CRRSecurity, CRRSecurity.id == CRRPortfolioConstituent.security_id)
+        .outerjoin(CRRLatestPrice, CRRLatestPrice.security_id == CRRPortfolioConstituent.security_id)
+        .where(CRRPortfolioConstituent.user_id == user_id)
+    )
+
+
 @router.get("/portfolio/", response_model=List[SecurityResponseCRR])
 async def get_portfolio(
         session: SessionDep, current_user: CurrentUser
 ) -> List[SecurityResponseCRR]:
-    def get_latest_price(sess: Session, model, model_id: uuid.UUID) -> Optional[float]:
-        latest_entry = sess.exec(
-            select(model)
-            .where(model.id == model_id)
-            .order_by(model.entry_date.desc())
-        ).first()
-        return latest_entry.price if latest_entry and latest_entry.price else None
-
-    portfolio_constituents = session.exec(
-        select(CRRPortfolioConstituent)
-        .where(CRRPortfolioConstituent.user_id == current_user.id)
-    ).all()
-
     portfolio = []
-    for constituent in portfolio_constituents:
-        security_name = session.get(CRRSecurity, constituent.security_id).ticker_bbg
-        cds_price = get_latest_price(session, CDSPrice, constituent.security_id)
-        crr_price = get_latest_price(session, CRRPrice, constituent.security_id)
-        spread = round(cds_price - crr_price, 2) if crr_price and cds_price else None
-
+    for constituent, security_name, cds_price, crr_price, spread in session.exec(
+            portfolio_statement(current_user.id)
+    ):
         portfolio.append(
             SecurityResponseCRR(
                 id=constituent.security_id,
@@ -101,75 +186,161 @@ async def remove_security_from_portfolio(
     return await get_portfolio(session, current_user)
 
 
+def _to_datetimes(epochs: np.ndarray) -> np.ndarray:
+    return np.round(epochs * 1e6).astype("datetime64[us]")
+
+
+def spread_regions(dates: np.ndarray, rolling: np.ndarray, threshold: float) -> List[SpreadRegion]:
+    """
+    Regions where the rolling spread stays above `threshold` (positive) or
+    below `-threshold` (negative). A region ends the day before the first
+    date outside of it; regions still open at the last date are left out.
+    Regions are ordered by the date closing them, positive first.
+    """
+    closed: list[tuple[int, bool, SpreadRegion]] = []
+    for kind, mask in (("positive", rolling > threshold), ("negative", rolling < -threshold)):
+        starts, ends = closed_runs(mask)
+        x1 = dates[starts].astype("datetime64[us]").tolist()
+        x2 = (dates[ends] - np.timedelta64(1, "D")).astype("datetime64[us]").tolist()
+        closed.extend((end, kind == "negative", SpreadRegion(spread=kind, x1=start, x2=stop))
+                      for end, start, stop in zip(ends.tolist(), x1, x2, strict=True))
+    closed.sort(key=lambda region: region[:2])
+    return [region for _, _, region in closed]
+
+
+def spread_analysis(cds: np.ndarray, crr: np.ndarray, days: int, deviation: int) -> SpreadAnalysisResponse:
+    """
+    The pandas path of calculate_spread_analysis on the (epoch, price)
+    columns of the CDS and CRR histories.
+    """
+    # Dates both histories have, (security_id, entry_date) is unique
+    dates, cds_rows, crr_rows = np.intersect1d(cds[:, 0], crr[:, 0], assume_unique=True, return_indices=True)
+    df = pd.DataFrame({"date": _to_datetimes(dates), "spread": cds[cds_rows, 1] - crr[crr_rows, 1]})
+    # Dates before the first full window count as no spread
+    df["rolling"] = df["spread"].rolling(window=days).mean().fillna(0)
+
+    # The standard deviation needs at least two dates
+    std_dev = df["rolling"].std() * deviation if len(df) > 1 else 0
+
+    regions = spread_regions(df["date"].to_numpy(), df["rolling"].to_numpy(), std_dev)
+
+    return SpreadAnalysisResponse(
+        regions=regions,
+        deviation=std_dev,
+    )
+
+
+# The pandas path of calculate_spread_analysis as one statement: the rolling
+# mean needs `days` non-null spreads and is 0 before that, regions are
+# closed runs of the threshold masks paired by their running start count.
+SPREAD_REGIONS_SQL = text("""
+    WITH spreads AS (
+        SELECT cds.entry_date AS date, cds.price - crr.price AS spread
+        FROM cds_prices cds
+        JOIN crr_prices crr ON crr.security_id = cds.security_id AND crr.entry_date = cds.entry_date
+        WHERE cds.security_id = :security_id
+    ),
+    rolling AS (
+        SELECT date,
+               CASE WHEN count(spread) OVER w = :days THEN avg(spread) OVER w ELSE 0 END AS rolling
+        FROM spreads
+        WINDOW w AS (ORDER BY date ROWS BETWEEN :preceding PRECEDING AND CURRENT ROW)
+    ),
+    threshold AS (
+        SELECT coalesce(stddev_samp(rolling), 0) * :deviation AS std_dev FROM rolling
+    ),
+    flags AS (
+        SELECT date,
+               rolling > std_dev AS positive,
+               rolling < -std_dev AS negative
+        FROM rolling, threshold
+    ),
+    edges AS (
+        SELECT date, positive, negative,
+               lag(positive, 1, false) OVER (ORDER BY date) AS was_positive,
+               lag(negative, 1, false) OVER (ORDER BY date) AS was_negative
+        FROM flags
+    ),
+    bounds AS (
+        SELECT 'positive' AS spread, date,
+               positive AND NOT was_positive AS starts, was_positive AND NOT positive AS ends
+        FROM edges
+        UNION ALL
+        SELECT 'negative', date,
+               negative AND NOT was_negative, was_negative AND NOT negative
+        FROM edges
+    ),
+    runs AS (
+        SELECT spread, date, starts, ends,
+               count(*) FILTER (WHERE starts) OVER (PARTITION BY spread ORDER BY date) AS run
+        FROM bounds
+        WHERE starts OR ends
+    ),
+    regions AS (
+        SELECT opening.spread, opening.date AS x1, closing.date - INTERVAL '1 day' AS x2, closing.date AS closed
+        FROM runs opening
+        JOIN runs closing ON closing.spread = opening.spread AND closing.run = opening.run AND closing.ends
+        WHERE opening.starts
+    )
+    SELECT threshold.std_dev, regions.spread, regions.x1, regions.x2
+    FROM threshold
+    LEFT JOIN regions ON true
+    ORDER BY regions.closed, regions.spread = 'negative'
+""")
+
+
+def _sql_spread_analysis(sess: Session, security_id: uuid.UUID, days: int, deviation: int) -> SpreadAnalysisResponse:
+    rows = sess.execute(SPREAD_REGIONS_SQL, {
+        "security_id": security_id, "days": days, "preceding": days - 1, "deviation": deviation,
+    }).all()
+    return SpreadAnalysisResponse(
+        regions=[SpreadRegion(spread=spread, x1=x1, x2=x2) for _, spread, x1, x2 in rows if spread is not None],
+        deviation=rows[0].std_dev,
+    )
+
+
 @router.get("/spread/{id}/", response_model=SpreadAnalysisResponse)
 async def calculate_spread_analysis(
         id: uuid.UUID,
-        days: int,
+        days: Annotated[int, Query(ge=1)],
         deviation: int,
         session: SessionDep, current_user: CurrentUser
 ):
-    cds_data = pd.DataFrame(
-        [cds.dict() for cds in session.exec(
-            select(CDSPrice)
-            .where(CDSPrice.security_id == id).order_by(CDSPrice.entry_date))
-        .all()]
-    )
-    cds_data = cds_data.rename(columns={"price": "cds_price", "entry_date": "date"})
+    if settings.SPREAD_ANALYSIS_ENGINE == "sql":
+        return _sql_spread_analysis(session, id, days, deviation)
 
-    crr_data = pd.DataFrame(
-        [crr.dict() for crr in session.exec(
-            select(CRRPrice)
-            .where(CRRPrice.security_id == id).order_by(CRRPrice.entry_date))
-        .all()]
-    )
-    crr_data = crr_data.rename(columns={"price": "crr_price", "entry_date": "date"})
-
-    df = pd.merge(cds_data, crr_data, on="date", how="inner")
-    df["spread"] = df["cds_price"] - df["crr_price"]
-    df["rolling"] = df["spread"].rolling(window=days).mean()
-
-    # Handle NaN values in 'rolling' explicitly
-    df["rolling"].fillna(0, inplace=True)
-
-    # Calculate standard deviation safely
-    if not df["rolling"].isna().all():
-        std_dev = df["rolling"].std() * deviation
-    else:
-        std_dev = 0  # Default value when std_dev can't be computed
-
-    regions = []
-    first_green, first_red = None, None
-    for _, row in df.iterrows():
-        if row["rolling"] > std_dev:
-            if first_green is None:
-                first_green = row["date"]
-        elif first_green:
-            regions.append(
-                SpreadRegion(spread="positive", x1=first_green, x2=row["date"] - timedelta(days=1))
-            )
-            first_green = None
-
-        if row["rolling"] < -std_dev:
-            if first_red is None:
-                first_red = row["date"]
-        elif first_red:
-            regions.append(
-                SpreadRegion(spread="negative", x1=first_red, x2=row["date"] - timedelta(days=1))
-            )
-            first_red = None
-
-    return SpreadAnalysisResponse(
-        regions=regions,
-        deviation=std_dev,
-    )
+    cds = _price_columns(session, CDSPrice, id)
+    crr = _price_columns(session, CRRPrice, id)
+    return spread_analysis(cds, crr, days, deviation)
 
 
 @router.get("/security/{id}/", response_model=SecurityDataResponse)
 async def get_security_data(
-    id: uuid.UUID, session: SessionDep, current_user: CurrentUser
-) -> SecurityDataResponse:
+    id: uuid.UUID, request: Request, response: Response, session: SessionDep, current_user: CurrentUser
+) -> Any:
+    media_type = negotiate_media_type(request, SERIES_MEDIA_TYPES)
+    etag = entity_tag(id, _price_history_version(session, id), media_type)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+
+    if media_type == NDJSON:
+        return ndjson_response(_stream_prices(id), headers=cache_headers(etag))
+
+    if media_type != JSON:
+        crr = _price_columns(session, CRRPrice, id)
+        cds = _price_columns(session, CDSPrice, id)
+        binary = columnar_response(media_type, {
+            "date": crr[:, 0].astype(np.int64),
+            "crr": crr[:, 1],
+            "cds": _align(crr[:, 0], cds[:, 0], cds[:, 1]),
+        })
+        binary.headers.update(cache_headers(etag))
+        return binary
+    response.headers.update(cache_headers(etag))
+
     def to_timestamp(dt: datetime) -> int:
-        return int(dt.timestamp())
+        return int(epoch_seconds(dt))
 
     crr_data = session.exec(
         select(CRRPrice)
@@ -212,8 +383,24 @@ async def search_securities(
 async def get_merton_data(
         id: uuid.UUID,
         period: int,
+        request: Request,
         session: SessionDep, current_user: CurrentUser
-) -> MertonDataResponse:
+) -> Any:
+    media_type = negotiate_media_type(request)
+    if media_type != JSON:
+        merton = np.array(session.exec(
+            select(_epoch(CRRMerton.entry_date), CRRMerton.cds_delta, CRRMerton.ps)
+            .where(CRRMerton.id == id, CRRMerton.cds_period == period)
+            .order_by(CRRMerton.entry_date)
+        ).all(), dtype=np.float64).reshape(-1, 3)
+        cds = _price_columns(session, CDSPrice, id)
+        return columnar_response(media_type, {
+            "date": merton[:, 0].astype(np.int64),
+            "cds_delta": merton[:, 1],
+            "probability_of_survival": merton[:, 2],
+            "price": _align(merton[:, 0], cds[:, 0], cds[:, 1]),
+        })
+
     merton_data = session.exec(
         select(CRRMerton)
         .where(CRRMerton.id == id, CRRMerton.cds_period == period)
@@ -1,45 +1,179 @@
-from typing import List
-from uuid import UUID
+import csv
+import io
+import itertools
+import uuid
+from collections.abc import Iterator, Sequence
+from datetime import datetime
+from typing import Annotated, Any, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile
+from pydantic import Field
 from sqlalchemy import delete
-from sqlalchemy.sql import func
-from sqlmodel import select
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, select
 
-from app.api.deps import SessionDep, CurrentUser
+from app import crud_mri
+from app.api.deps import SessionDep, CurrentUser, get_current_active_superuser, get_current_user
+from app.api.responses import (
+    JSON,
+    NDJSON,
+    SERIES_MEDIA_TYPES,
+    cache_headers,
+    columnar_response,
+    nan_to_none,
+    entity_tag,
+    ndjson_response,
+    negotiate_media_type,
+    not_modified,
+)
+from app.core.db import engine
 from app.models_mri import (
+    DEFAULT_PORTFOLIO_ID,
     MRIPortfolio,
     MRIPortfolioConstituent,
-    MRIAssetOutput,
+    PortfolioAnalyticsResponse,
+    PortfolioBatchRequest,
+    PortfolioContributionsResponse,
+    PortfolioBatchResponse,
+    PortfolioConstituentCreate,
     PortfolioCreate,
     PortfolioUpdate,
     PortfolioResponse,
     PortfolioConstituentResponse,
+    WhatIfRequest,
+    WhatIfResponse,
 )
+from app.timeseries import epoch_seconds, lttb
 
 router = APIRouter()
 
 
+def _portfolio_response(
+        portfolio: MRIPortfolio, constituents: Sequence[MRIPortfolioConstituent]
+) -> PortfolioResponse:
+    return PortfolioResponse(
+        id=str(portfolio.id),
+        name=portfolio.name,
+        user_id=str(portfolio.user_id),
+        assets=[
+            PortfolioConstituentResponse(
+                id=str(constituent.id),
+                asset_name=constituent.asset_name,
+                asset_domain=constituent.asset_domain,
+                asset_class=constituent.asset_class,
+                weight=constituent.weight,
+            )
+            for constituent in constituents
+        ]
+    )
+
+
+DEFAULT_PORTFOLIO_LOOKBACK = 252
+# About ten years of daily points
+MAX_ANALYTICS_WINDOW = 2520
+DEFAULT_ANALYTICS_WINDOWS = (21,)
+DEFAULT_ANALYTICS_PERCENTILES = (5.0, 95.0)
+
+# Pre-serialized JSON of the default portfolio, keyed on (dataset version, portfolio version, name)
+_default_portfolio: Optional[Tuple[Tuple[int, int, str], bytes]] = None
+
+
+def _default_portfolio_key(session: Session) -> Optional[Tuple[int, int, str]]:
+    row = session.exec(
+        select(MRIPortfolio.version, MRIPortfolio.name).where(MRIPortfolio.id == DEFAULT_PORTFOLIO_ID)
+    ).first()
+    if row is None:
+        return None
+    return crud_mri.get_dataset_version(session=session), *row
+
+
+def warm_default_portfolio(
+        session: Session, key: Optional[Tuple[int, int, str]] = None
+) -> Optional[bytes]:
+    """
+    Build and keep the serialized default portfolio response under `key`,
+    the caller's _default_portfolio_key or the current one. Runs at startup
+    and on the first request after an ingest or an edit made the kept one
+    stale: the seeder runs in its own process, so that request rebuilds it.
+    """
+    global _default_portfolio
+
+    if key is None:
+        key = _default_portfolio_key(session)
+    portfolio = session.get(MRIPortfolio, DEFAULT_PORTFOLIO_ID)
+    if key is None or portfolio is None:
+        _default_portfolio = None
+        return None
+    timestamps, values = crud_mri.get_cached_portfolio_series(
+        session=session, portfolio=portfolio, lookback=DEFAULT_PORTFOLIO_LOOKBACK
+    )
+    response = _portfolio_response(portfolio, portfolio.assets)
+    response.time_series = [
+        {"Date": date, "Value": value} for date, value in zip(timestamps.tolist(), values.tolist(), strict=True)
+    ]
+    body = response.model_dump_json().encode()
+    # Keep the rows a first read of the series materialized
+    session.commit()
+    _default_portfolio = (key, body)
+    return body
+
+
+def _stream_portfolio(
+        body: PortfolioResponse,
+        *,
+        portfolio_id: uuid.UUID,
+        lookback: int,
+        start: Optional[datetime],
+        end: Optional[datetime],
+) -> Iterator[Dict[str, Any]]:
+    yield body.model_dump(exclude={"time_series"})
+    # The request session is closed before a streamed body is sent
+    with Session(engine) as session:
+        for date, value in crud_mri.stream_portfolio_series(
+                session=session, portfolio_id=portfolio_id, lookback=lookback, start=start, end=end
+        ):
+            yield {"Date": epoch_seconds(date), "Value": value}
+
+
 @router.get("/default-portfolio", response_model=PortfolioResponse, tags=["mri"])
 def get_default_portfolio(
-        *, session: SessionDep, current_user: CurrentUser
-) -> PortfolioResponse:
-    return get_portfolio(session=session, current_user=current_user, id="00000000-0000-0000-0000-000000000000",
-                         lookback=252)
+        *, request: Request, response: Response, session: SessionDep, current_user: CurrentUser
+) -> Any:
+    if negotiate_media_type(request, SERIES_MEDIA_TYPES) != JSON:
+        return get_portfolio(request=request, response=response, session=session, current_user=current_user,
+                             id=str(DEFAULT_PORTFOLIO_ID), lookback=DEFAULT_PORTFOLIO_LOOKBACK)
+
+    key = _default_portfolio_key(session)
+    if key is None:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    etag = entity_tag(DEFAULT_PORTFOLIO_ID, *key, DEFAULT_PORTFOLIO_LOOKBACK, JSON)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    cached = _default_portfolio
+    body = cached[1] if cached is not None and cached[0] == key else warm_default_portfolio(session, key)
+    return Response(content=body, media_type=JSON, headers=cache_headers(etag))
+
+
+@router.get("/cache-stats", dependencies=[Depends(get_current_active_superuser)])
+def get_cache_stats() -> Dict[str, int]:
+    """
+    Hit, miss and eviction counters of the portfolio time series cache.
+    """
+    return crud_mri.portfolio_series_cache.stats()
 
 
 @router.get("/", response_model=List[PortfolioResponse])
 def get_user_portfolios(
         *, session: SessionDep, current_user: CurrentUser
 ) -> List[PortfolioResponse]:
+    # Constituents are loaded for all portfolios in one batched IN query
     portfolios = session.exec(
-        select(MRIPortfolio).where(MRIPortfolio.user_id == current_user.id)
-    ).all()
-
-    admin_portfolios = session.exec(
-        select(MRIPortfolio).where(MRIPortfolio.user_id == UUID("00000000-0000-0000-0000-000000000000"))
+        select(MRIPortfolio)
+        .where(MRIPortfolio.user_id.in_([current_user.id, DEFAULT_PORTFOLIO_ID]))
+        .order_by(MRIPortfolio.user_id == DEFAULT_PORTFOLIO_ID)
+        .options(selectinload(MRIPortfolio.assets))
     ).all()
-    portfolios.extend(admin_portfolios)
 
     response = [
         PortfolioResponse(
@@ -54,11 +188,7 @@ def get_user_portfolios(
                     asset_class=asset.asset_class,
                     weight=asset.weight
                 )
-                for asset in session.exec(
-                    select(MRIPortfolioConstituent).where(
-                        MRIPortfolioConstituent.portfolio_id == portfolio.id
-                    )
-                ).all()
+                for asset in portfolio.assets
             ]
         )
         for portfolio in portfolios
@@ -67,56 +197,262 @@ def get_user_portfolios(
     return response
 
 
+@router.post("/batch", response_model=PortfolioBatchResponse)
+def get_portfolios_batch(
+        *, session: SessionDep, current_user: CurrentUser, batch_in: PortfolioBatchRequest
+) -> PortfolioBatchResponse:
+    """
+    Time series of several portfolios at several lookbacks in one request.
+    """
+    portfolio_ids = list(dict.fromkeys(batch_in.portfolio_ids))
+    lookbacks = list(dict.fromkeys(batch_in.lookbacks))
+    portfolios = session.exec(select(MRIPortfolio).where(MRIPortfolio.id.in_(portfolio_ids))).all()
+    if len(portfolios) != len(portfolio_ids):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    if any(portfolio.id != DEFAULT_PORTFOLIO_ID and portfolio.user_id != current_user.id for portfolio in portfolios):
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    series = crud_mri.get_portfolios_series(session=session, portfolio_ids=portfolio_ids, lookbacks=lookbacks)
+    # Keep the rows a first read of the series materialized
+    session.commit()
+    response: Dict[str, Dict[int, List[Dict[str, float]]]] = {}
+    for (portfolio_id, lookback), points in series.items():
+        response.setdefault(str(portfolio_id), {})[lookback] = [
+            {"Date": epoch_seconds(date), "Value": value} for date, value in points
+        ]
+    return PortfolioBatchResponse(series=response)
+
+
+@router.post("/what-if", response_model=WhatIfResponse, dependencies=[Depends(get_current_user)])
+def get_what_if_series(
+        *,
+        request: Request,
+        session: SessionDep,
+        what_if_in: WhatIfRequest,
+        max_points: Annotated[Optional[int], Query(ge=3)] = None,
+) -> Any:
+    """
+    Time series of ad-hoc weights without saving them as a portfolio.
+    """
+    timestamps, values = crud_mri.get_weighted_series(
+        session=session,
+        weights=[(asset.asset_class, asset.asset_domain, asset.weight) for asset in what_if_in.assets],
+        lookback=what_if_in.lookback,
+    )
+    if max_points is not None and len(timestamps) > max_points:
+        selected = lttb(timestamps, values, max_points)
+        timestamps, values = timestamps[selected], values[selected]
+
+    media_type = negotiate_media_type(request)
+    if media_type != JSON:
+        return columnar_response(
+            media_type, {"Date": timestamps, "Value": values}, metadata={"lookback": what_if_in.lookback}
+        )
+    return WhatIfResponse(
+        lookback=what_if_in.lookback,
+        time_series=[
+            {"Date": date, "Value": value} for date, value in zip(timestamps.tolist(), values.tolist(), strict=True)
+        ],
+    )
+
+
 @router.get("/{id}", response_model=PortfolioResponse)
 def get_portfolio(
-        *, session: SessionDep, current_user: CurrentUser, id: str, lookback: int
-) -> PortfolioResponse:
+        *,
+        request: Request,
+        response: Response,
+        session: SessionDep,
+        current_user: CurrentUser,
+        id: str,
+        lookback: int,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        max_points: Annotated[Optional[int], Query(ge=3)] = None,
+) -> Any:
     portfolio = session.get(MRIPortfolio, id)
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
-    if id != "00000000-0000-0000-0000-000000000000" and portfolio.user_id != current_user.id:
+    if portfolio.id != DEFAULT_PORTFOLIO_ID and portfolio.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
+    # The representation only changes with the portfolio or the dataset, answer revalidations before any series query
+    media_type = negotiate_media_type(request, SERIES_MEDIA_TYPES)
+    etag = entity_tag(portfolio.id, portfolio.version, portfolio.name, crud_mri.get_dataset_version(session=session),
+                      lookback, start, end, max_points, media_type)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+
     constituents = session.exec(
         select(MRIPortfolioConstituent).where(
             MRIPortfolioConstituent.portfolio_id == id
         )
     ).all()
+    body = _portfolio_response(portfolio, constituents)
 
-    assets = []
-    aggregated_data = session.exec(
-        select(
-            MRIAssetOutput.date,
-            func.sum(MRIAssetOutput.rpr * MRIPortfolioConstituent.weight).label("Value")
+    if media_type == NDJSON and max_points is None:
+        # The portfolio first, then one point per line read straight off a server-side cursor,
+        # whose session only sees a committed fill
+        if crud_mri.ensure_portfolio_series(session=session, portfolio_id=portfolio.id, lookback=lookback):
+            session.commit()
+        return ndjson_response(
+            _stream_portfolio(body, portfolio_id=portfolio.id, lookback=lookback, start=start, end=end),
+            headers=cache_headers(etag),
         )
-        .join(MRIPortfolioConstituent,
-              (MRIAssetOutput.asset_class == MRIPortfolioConstituent.asset_class) &
-              (MRIAssetOutput.domain == MRIPortfolioConstituent.asset_domain))
-        .where(
-            MRIPortfolioConstituent.portfolio_id == id,
-            MRIAssetOutput.lookback == lookback
-        )
-        .group_by(MRIAssetOutput.date)
-        .order_by(MRIAssetOutput.date)
-    ).all()
 
-    for constituent in constituents:
-        assets.append(
-            PortfolioConstituentResponse(
-                id=str(constituent.id),
-                asset_name=constituent.asset_name,
-                asset_domain=constituent.asset_domain,
-                asset_class=constituent.asset_class,
-                weight=constituent.weight,
+    if start is None and end is None:
+        timestamps, values = crud_mri.get_cached_portfolio_series(
+            session=session, portfolio=portfolio, lookback=lookback
+        )
+    else:
+        timestamps, values = crud_mri.series_to_arrays(
+            crud_mri.get_portfolio_series(
+                session=session, portfolio_id=portfolio.id, lookback=lookback, start=start, end=end
             )
         )
+    # Keep the rows a first read of the series materialized
+    session.commit()
+    if max_points is not None and len(timestamps) > max_points:
+        selected = lttb(timestamps, values, max_points)
+        timestamps, values = timestamps[selected], values[selected]
 
-    return PortfolioResponse(
-        id=str(portfolio.id),
-        name=portfolio.name,
-        user_id=str(portfolio.user_id),
+    if media_type == NDJSON:
+        points = (
+            {"Date": date, "Value": value}
+            for date, value in zip(timestamps.tolist(), values.tolist(), strict=True)
+        )
+        return ndjson_response(
+            itertools.chain([body.model_dump(exclude={"time_series"})], points), headers=cache_headers(etag)
+        )
+    if media_type != JSON:
+        binary = columnar_response(
+            media_type,
+            {"Date": timestamps, "Value": values},
+            metadata=body.model_dump(exclude={"time_series"}),
+        )
+        binary.headers.update(cache_headers(etag))
+        return binary
+    response.headers.update(cache_headers(etag))
+    body.time_series = [
+        {"Date": date, "Value": value} for date, value in zip(timestamps.tolist(), values.tolist(), strict=True)
+    ]
+    return body
+
+
+@router.get("/{id}/analytics", response_model=PortfolioAnalyticsResponse)
+def get_portfolio_analytics(
+        *,
+        request: Request,
+        response: Response,
+        session: SessionDep,
+        current_user: CurrentUser,
+        id: str,
+        lookback: int,
+        windows: Annotated[Optional[List[Annotated[int, Field(ge=2, le=MAX_ANALYTICS_WINDOW)]]],
+                           Query(min_length=1, max_length=5)] = None,
+        percentiles: Annotated[Optional[List[Annotated[float, Field(ge=0, le=100)]]], Query(max_length=9)] = None,
+) -> Any:
+    """
+    Drawdown, rolling mean, volatility and percentile bands of a portfolio
+    series for each of the given windows, as columns aligned with Date.
+    Windows default to 21 points and percentiles to the 5th and 95th.
+    """
+    if windows is None:
+        windows = list(DEFAULT_ANALYTICS_WINDOWS)
+    if percentiles is None:
+        percentiles = list(DEFAULT_ANALYTICS_PERCENTILES)
+    portfolio = session.get(MRIPortfolio, id)
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    if portfolio.id != DEFAULT_PORTFOLIO_ID and portfolio.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    media_type = negotiate_media_type(request)
+    etag = entity_tag(portfolio.id, portfolio.version, crud_mri.get_dataset_version(session=session),
+                      lookback, windows, percentiles, media_type, "analytics")
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+
+    # Rejected before any rolling statistic is computed
+    _, values = crud_mri.get_cached_portfolio_series(session=session, portfolio=portfolio, lookback=lookback)
+    if max(windows) > len(values):
+        raise HTTPException(
+            status_code=422,
+            detail=f"Window {max(windows)} is longer than the series ({len(values)} points)",
+        )
+    columns = crud_mri.get_cached_portfolio_analytics(
+        session=session, portfolio=portfolio, lookback=lookback, windows=windows, percentiles=percentiles
+    )
+    # Keep the rows a first read of the series materialized
+    session.commit()
+    drawdown = columns["drawdown"]
+    max_drawdown = float(drawdown.min()) if len(drawdown) else None
+    if media_type != JSON:
+        binary = columnar_response(
+            media_type, columns, metadata={"lookback": lookback, "max_drawdown": max_drawdown}
+        )
+        binary.headers.update(cache_headers(etag))
+        return binary
+    response.headers.update(cache_headers(etag))
+    return PortfolioAnalyticsResponse(
+        lookback=lookback,
+        max_drawdown=max_drawdown,
+        series={
+            name: nan_to_none(column) for name, column in columns.items()
+        },
+    )
+
+
+@router.get("/{id}/contributions", response_model=PortfolioContributionsResponse)
+def get_portfolio_contributions(
+        *,
+        request: Request,
+        response: Response,
+        session: SessionDep,
+        current_user: CurrentUser,
+        id: str,
+        lookback: int,
+) -> Any:
+    """
+    Contribution (rpr * weight) of every constituent on every date, one
+    column per constituent id. The columns of a date add up to the
+    portfolio value.
+    """
+    portfolio = session.get(MRIPortfolio, id)
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    if portfolio.id != DEFAULT_PORTFOLIO_ID and portfolio.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    media_type = negotiate_media_type(request)
+    etag = entity_tag(portfolio.id, portfolio.version, portfolio.name, crud_mri.get_dataset_version(session=session),
+                      lookback, media_type, "contributions")
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+
+    constituents = portfolio.assets
+    timestamps, contributions = crud_mri.get_portfolio_contributions(
+        session=session, constituents=constituents, lookback=lookback
+    )
+    assets = _portfolio_response(portfolio, constituents).assets
+    columns = {"Date": timestamps}
+    columns.update((str(constituent.id), contributions[:, i]) for i, constituent in enumerate(constituents))
+    if media_type != JSON:
+        binary = columnar_response(
+            media_type, columns,
+            metadata={"lookback": lookback, "assets": [asset.model_dump() for asset in assets]},
+        )
+        binary.headers.update(cache_headers(etag))
+        return binary
+    response.headers.update(cache_headers(etag))
+    return PortfolioContributionsResponse(
+        lookback=lookback,
         assets=assets,
-        time_series=[{"Date": date.timestamp(), "Value": value} for date, value in aggregated_data]
+        contributions={
+            name: nan_to_none(column) for name, column in columns.items()
+        },
     )
 
 
@@ -124,42 +460,43 @@ def get_portfolio(
 def create_portfolio(
         *, session: SessionDep, current_user: CurrentUser, portfolio_in: PortfolioCreate
 ) -> PortfolioResponse:
-    portfolio = MRIPortfolio(
-        name=portfolio_in.name,
-        user_id=str(current_user.id)
+    [(portfolio, constituents)] = crud_mri.create_portfolios(
+        session=session, portfolios_in=[portfolio_in], user_id=current_user.id
     )
-    session.add(portfolio)
+    response = _portfolio_response(portfolio, constituents)
     session.commit()
-    session.refresh(portfolio)
-
-    assets = []
-    for asset in portfolio_in.assets:
-        constituent = MRIPortfolioConstituent(
-            portfolio_id=str(portfolio.id),
-            asset_name=asset.asset_name,
-            asset_domain=asset.asset_domain,
-            asset_class=asset.asset_class,
-            weight=asset.weight,
-        )
-        session.add(constituent)
-        session.commit()
-        session.refresh(constituent)
-        assets.append(
-            PortfolioConstituentResponse(
-                id=str(constituent.id),
-                asset_name=constituent.asset_name,
-                asset_domain=constituent.asset_domain,
-                asset_class=constituent.asset_class,
-                weight=constituent.weight
+    return response
+
+
+@router.post("/import", response_model=List[PortfolioResponse])
+def import_portfolios(
+        *, session: SessionDep, current_user: CurrentUser, file: UploadFile
+) -> List[PortfolioResponse]:
+    """
+    Create many portfolios from a CSV upload with the columns
+    name, asset_name, asset_domain, asset_class, weight (one row per constituent).
+    """
+    portfolios_in: Dict[str, PortfolioCreate] = {}
+    try:
+        for row in csv.DictReader(io.TextIOWrapper(file.file, encoding="utf-8-sig")):
+            portfolio_in = portfolios_in.setdefault(row["name"], PortfolioCreate(name=row["name"], assets=[]))
+            portfolio_in.assets.append(
+                PortfolioConstituentCreate(
+                    asset_name=row["asset_name"],
+                    asset_domain=row["asset_domain"],
+                    asset_class=row["asset_class"],
+                    weight=row["weight"],
+                )
             )
-        )
+    except (KeyError, ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid portfolio CSV: {e}")
 
-    return PortfolioResponse(
-        id=str(portfolio.id),
-        name=portfolio.name,
-        user_id=str(portfolio.user_id),
-        assets=assets
+    created = crud_mri.create_portfolios(
+        session=session, portfolios_in=list(portfolios_in.values()), user_id=current_user.id
     )
+    response = [_portfolio_response(portfolio, constituents) for portfolio, constituents in created]
+    session.commit()
+    return response
 
 
 @router.put("/{id}", response_model=PortfolioResponse)
@@ -176,38 +513,23 @@ def update_portfolio(
     if portfolio.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    portfolio.name = portfolio_in.name
-    session.add(portfolio)
+    if portfolio_in.name is not None:
+        portfolio.name = portfolio_in.name
+        session.add(portfolio)
 
-    session.exec(
-        delete(MRIPortfolioConstituent).where(
-            MRIPortfolioConstituent.portfolio_id == id
-        )
-    )
+    if portfolio_in.assets is None:
+        constituents = portfolio.assets
+    else:
+        try:
+            constituents = crud_mri.update_portfolio_constituents(
+                session=session, portfolio=portfolio, assets_in=portfolio_in.assets
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-    for asset in portfolio_in.assets:
-        constituent = MRIPortfolioConstituent(
-            portfolio_id=str(id),
-            asset_name=asset.asset_name,
-            asset_domain=asset.asset_domain,
-            asset_class=asset.asset_class,
-            weight=asset.weight,
-        )
-        session.add(constituent)
+    response = _portfolio_response(portfolio, constituents)
     session.commit()
-    session.refresh(portfolio)
-
-    db_assets = session.exec(select(MRIPortfolioConstituent).where(MRIPortfolioConstituent.portfolio_id == id))
-    assets = [
-        PortfolioConstituentResponse(id=str(asset.id), asset_name=asset.asset_name, asset_domain=asset.asset_domain,
-                                     asset_class=asset.asset_class, weight=asset.weight, ) for asset in
-        db_assets.all()]
-    return PortfolioResponse(
-        id=str(portfolio.id),
-        name=portfolio.name,
-        user_id=str(portfolio.user_id),
-        assets=assets
-    )
+    return response
 
 
 @router.delete("/{id}")
@@ -226,6 +548,7 @@ def delete_portfolio(
         )
     )
 
+    crud_mri.invalidate_portfolio_series(portfolio_id=portfolio.id)
     session.delete(portfolio)
     session.commit()
     return None
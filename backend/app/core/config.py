@@ -1,8 +1,10 @@
 import secrets
 import warnings
+from pathlib import Path
 from typing import Annotated, Any, Literal
 
 from pydantic import (
+    AfterValidator,
     AnyUrl,
     BeforeValidator,
     HttpUrl,
@@ -23,6 +25,22 @@ def parse_cors(v: Any) -> list[str] | str:
     raise ValueError(v)
 
 
+def parse_list(v: Any) -> list[str] | str:
+    if isinstance(v, str):
+        return [i.strip() for i in v.split(",") if i.strip()]
+    elif isinstance(v, list):
+        return v
+    raise ValueError(v)
+
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+
+def backend_path(v: str) -> str:
+    # Relative paths are taken from ./backend/, not the working directory
+    return str(BACKEND_DIR / v)
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
         # Use top level .env file (one level above ./backend/)
@@ -68,6 +86,18 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # In-process cache of MRI portfolio time series
+    MRI_SERIES_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    MRI_SERIES_CACHE_TTL_SECONDS: int = 60 * 60
+    # Memory-mapped asset output matrix, written by the seeder after ingest
+    MRI_SNAPSHOT_DIR: Annotated[str, AfterValidator(backend_path)] = "data/mri_snapshot"
+    # Directories the seeder loads *_long.csv / *_short.csv asset outputs from
+    MRI_DATA_DIRS: Annotated[
+        list[Annotated[str, AfterValidator(backend_path)]] | str, BeforeValidator(parse_list)
+    ] = ["data"]
+    # Where calculate_spread_analysis joins and rolls the price histories
+    SPREAD_ANALYSIS_ENGINE: Literal["pandas", "sql"] = "pandas"
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -0,0 +1,83 @@
+"""
+Yearly range partitions of the append-only time series tables.
+
+Each table is partitioned by RANGE on its date column into `<table>_y<year>`
+partitions plus a `<table>_default` partition catching rows of years that
+have no partition yet. `ensure_partitions` runs at startup and on ingest;
+it creates upcoming partitions and moves rows out of the default one.
+"""
+import re
+from collections.abc import Iterable
+from datetime import date
+
+from sqlalchemy import DDL, text
+from sqlalchemy.orm import Session
+
+# Partitioned table -> partition key column
+PARTITIONED_TABLES = {
+    "mri_asset_outputs": "date",
+    "cds_prices": "entry_date",
+    "crr_prices": "entry_date",
+}
+
+# How long the partition DDL waits for its ACCESS EXCLUSIVE lock. Queued
+# behind a long transaction it would block every reader of the table.
+PARTITION_LOCK_TIMEOUT = "5s"
+
+_PARTITION_NAME = re.compile(rf"^({'|'.join(PARTITIONED_TABLES)})_(default|y\d{{4}})$")
+
+
+def partition_by(table: str) -> str:
+    return f"RANGE ({PARTITIONED_TABLES[table]})"
+
+
+def default_partition_ddl(table: str) -> DDL:
+    """
+    DDL creating the DEFAULT partition, attached to the parent's after_create event.
+    """
+    return DDL(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+
+def is_partition(name: str) -> bool:
+    return _PARTITION_NAME.match(name) is not None
+
+
+def ensure_partitions(session: Session, *, years: Iterable[int] = ()) -> list[str]:
+    """
+    Create the yearly partitions of every partitioned table for `years`, the
+    current and the next year, and for every year with rows in the DEFAULT
+    partition, whose rows are moved into the new partition. Returns the
+    names of the created partitions. The caller commits.
+
+    Fails with a lock timeout after PARTITION_LOCK_TIMEOUT instead of waiting
+    for a busy table, rows of missing years go to the DEFAULT partition
+    until a later call succeeds.
+    """
+    session.execute(text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"))
+    this_year = date.today().year
+    wanted = {*years, this_year, this_year + 1}
+    created = []
+    for table, column in PARTITIONED_TABLES.items():
+        default_years = session.execute(text(
+            f"SELECT DISTINCT extract(year FROM {column})::int FROM {table}_default"
+        )).scalars()
+        for year in sorted(wanted | set(default_years)):
+            name = f"{table}_y{year}"
+            if session.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+                continue
+            start, end = f"{year}-01-01", f"{year + 1}-01-01"
+            # A new partition cannot be attached while the default one holds rows of its range
+            session.execute(text(f"""
+                CREATE TEMPORARY TABLE {name}_moved ON COMMIT DROP AS
+                WITH moved AS (
+                    DELETE FROM {table}_default WHERE {column} >= '{start}' AND {column} < '{end}' RETURNING *
+                )
+                SELECT * FROM moved
+            """))
+            session.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM ('{start}') TO ('{end}')"
+            ))
+            session.execute(text(f"INSERT INTO {table} SELECT * FROM {name}_moved"))
+            session.execute(text(f"DROP TABLE {name}_moved"))
+            created.append(name)
+    return created
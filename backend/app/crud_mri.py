@@ -0,0 +1,508 @@
+import uuid
+from collections.abc import Iterator, Sequence
+from datetime import datetime
+from typing import Any
+
+import numpy as np
+from sqlalchemy import DateTime, Float, String, cast, column, delete, insert, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.sql import func
+from sqlmodel import Session, select
+
+from app import mri_matrix
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.models_mri import (
+    MRIAsset,
+    MRIAssetOutput,
+    MRIDatasetVersion,
+    MRIPortfolio,
+    MRIPortfolioConstituent,
+    MRIPortfolioSeries,
+    PortfolioConstituentUpdate,
+    PortfolioCreate,
+)
+from app.timeseries import epoch_seconds, rolling_analytics
+
+# Keyed on (portfolio_id, lookback, portfolio version, dataset version), followed
+# by the parameters for values derived from the series
+portfolio_series_cache = LRUCache(
+    max_bytes=settings.MRI_SERIES_CACHE_MAX_BYTES,
+    ttl=settings.MRI_SERIES_CACHE_TTL_SECONDS,
+)
+_cached_dataset_version: int | None = None
+
+# Rows fetched per round trip when a series is streamed
+SERIES_STREAM_BATCH_SIZE = 5000
+
+
+def get_dataset_version(*, session: Session) -> int:
+    dataset_version = session.get(MRIDatasetVersion, 1)
+    return dataset_version.version if dataset_version else 0
+
+
+def bump_dataset_version(*, session: Session) -> None:
+    """
+    Mark the asset outputs as changed after an ingest. The caller commits.
+    """
+    session.execute(
+        pg_insert(MRIDatasetVersion)
+        .values(id=1, version=1)
+        .on_conflict_do_update(
+            index_elements=[MRIDatasetVersion.id],
+            set_={"version": MRIDatasetVersion.version + 1},
+        )
+    )
+
+
+def get_or_create_asset(*, session: Session, asset_class: str, domain: str) -> MRIAsset:
+    """
+    Catalog entry of an (asset_class, domain) pair. The caller commits.
+    """
+    asset = session.exec(
+        select(MRIAsset).where(MRIAsset.asset_class == asset_class, MRIAsset.domain == domain)
+    ).first()
+    if asset is None:
+        asset = MRIAsset(asset_class=asset_class, domain=domain)
+        session.add(asset)
+        session.flush()
+    return asset
+
+
+def invalidate_portfolio_series(*, portfolio_id: uuid.UUID) -> None:
+    portfolio_series_cache.invalidate(lambda key: key[0] == portfolio_id)
+
+
+def portfolio_series_statement(
+    *,
+    portfolio_ids: Sequence[uuid.UUID] | None = None,
+    lookback: int | None = None,
+    since: datetime | None = None,
+) -> Any:
+    """
+    Aggregate asset outputs into (portfolio_id, lookback, date, value) rows.
+    """
+    statement = (
+        select(
+            MRIPortfolioConstituent.portfolio_id,
+            MRIAssetOutput.lookback,
+            MRIAssetOutput.date,
+            func.sum(MRIAssetOutput.rpr * MRIPortfolioConstituent.weight).label("value"),
+        )
+        .select_from(MRIPortfolioConstituent)
+        .join(MRIAsset,
+              (MRIAsset.asset_class == MRIPortfolioConstituent.asset_class) &
+              (MRIAsset.domain == MRIPortfolioConstituent.asset_domain))
+        .join(MRIAssetOutput, MRIAssetOutput.asset_id == MRIAsset.id)
+        .group_by(MRIPortfolioConstituent.portfolio_id, MRIAssetOutput.lookback, MRIAssetOutput.date)
+    )
+    if portfolio_ids is not None:
+        statement = statement.where(MRIPortfolioConstituent.portfolio_id.in_(portfolio_ids))
+    if lookback is not None:
+        statement = statement.where(MRIAssetOutput.lookback == lookback)
+    if since is not None:
+        statement = statement.where(MRIAssetOutput.date >= since)
+    return statement
+
+
+def _insert_series(*, session: Session, statement: Any) -> None:
+    session.execute(
+        insert(MRIPortfolioSeries).from_select(
+            ["portfolio_id", "lookback", "date", "value"], statement
+        )
+    )
+
+
+def rebuild_portfolio_series(
+    *, session: Session, portfolio_ids: Sequence[uuid.UUID], lookback: int | None = None
+) -> None:
+    """
+    Recompute the materialized series of the given portfolios. The caller commits.
+    """
+    statement = delete(MRIPortfolioSeries).where(MRIPortfolioSeries.portfolio_id.in_(portfolio_ids))
+    if lookback is not None:
+        statement = statement.where(MRIPortfolioSeries.lookback == lookback)
+    session.execute(statement)
+    _insert_series(
+        session=session,
+        statement=portfolio_series_statement(portfolio_ids=portfolio_ids, lookback=lookback),
+    )
+
+
+def extend_portfolio_series(*, session: Session, since: datetime) -> None:
+    """
+    Recompute every portfolio's series from `since` onwards after new asset
+    outputs were ingested. The caller commits.
+    """
+    session.execute(delete(MRIPortfolioSeries).where(MRIPortfolioSeries.date >= since))
+    _insert_series(session=session, statement=portfolio_series_statement(since=since))
+
+
+def _portfolio_series_statement(
+    *, portfolio_id: uuid.UUID, lookback: int, start: datetime | None, end: datetime | None
+) -> Any:
+    statement = (
+        select(MRIPortfolioSeries.date, MRIPortfolioSeries.value)
+        .where(
+            MRIPortfolioSeries.portfolio_id == portfolio_id,
+            MRIPortfolioSeries.lookback == lookback,
+        )
+        .order_by(MRIPortfolioSeries.date)
+    )
+    if start is not None:
+        statement = statement.where(MRIPortfolioSeries.date >= start)
+    if end is not None:
+        statement = statement.where(MRIPortfolioSeries.date <= end)
+    return statement
+
+
+def fill_portfolio_series(
+    *, session: Session, portfolio_ids: Sequence[uuid.UUID], lookback: int | None = None
+) -> None:
+    """
+    Materialize the missing rows of the given portfolios' series. Rows that
+    exist are left alone, so concurrent fills of the same series do not
+    conflict. The caller commits.
+    """
+    session.execute(
+        pg_insert(MRIPortfolioSeries)
+        .from_select(
+            ["portfolio_id", "lookback", "date", "value"],
+            portfolio_series_statement(portfolio_ids=portfolio_ids, lookback=lookback),
+        )
+        .on_conflict_do_nothing()
+    )
+
+
+def ensure_portfolio_series(*, session: Session, portfolio_id: uuid.UUID, lookback: int) -> bool:
+    """
+    Materialize a series that never was, returns whether it had to try. The
+    caller commits.
+    """
+    if session.exec(
+        select(MRIPortfolioSeries.date).where(
+            MRIPortfolioSeries.portfolio_id == portfolio_id,
+            MRIPortfolioSeries.lookback == lookback,
+        ).limit(1)
+    ).first():
+        return False
+    # Outputs written outside the ingest path have not been materialized yet
+    fill_portfolio_series(session=session, portfolio_ids=[portfolio_id], lookback=lookback)
+    return True
+
+
+def get_portfolio_series(
+    *,
+    session: Session,
+    portfolio_id: uuid.UUID,
+    lookback: int,
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> list[tuple[datetime, float]]:
+    statement = _portfolio_series_statement(portfolio_id=portfolio_id, lookback=lookback, start=start, end=end)
+    series = session.exec(statement).all()
+    if not series and ensure_portfolio_series(session=session, portfolio_id=portfolio_id, lookback=lookback):
+        series = session.exec(statement).all()
+    return list(series)
+
+
+def stream_portfolio_series(
+    *,
+    session: Session,
+    portfolio_id: uuid.UUID,
+    lookback: int,
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> Iterator[tuple[datetime, float]]:
+    """
+    Iterate a materialized series through a server-side cursor, so memory
+    does not grow with its length. Call ensure_portfolio_series first.
+    """
+    statement = _portfolio_series_statement(portfolio_id=portfolio_id, lookback=lookback, start=start, end=end)
+    yield from session.exec(statement.execution_options(yield_per=SERIES_STREAM_BATCH_SIZE))
+
+
+def get_portfolios_series(
+    *, session: Session, portfolio_ids: Sequence[uuid.UUID], lookbacks: Sequence[int]
+) -> dict[tuple[uuid.UUID, int], list[tuple[datetime, float]]]:
+    """
+    Read the series of every (portfolio, lookback) combination in a single
+    range scan over the materialized table. The caller commits.
+    """
+    def read() -> dict[tuple[uuid.UUID, int], list[tuple[datetime, float]]]:
+        rows = session.exec(
+            select(
+                MRIPortfolioSeries.portfolio_id,
+                MRIPortfolioSeries.lookback,
+                MRIPortfolioSeries.date,
+                MRIPortfolioSeries.value,
+            )
+            .where(
+                MRIPortfolioSeries.portfolio_id.in_(portfolio_ids),
+                MRIPortfolioSeries.lookback.in_(lookbacks),
+            )
+            .order_by(MRIPortfolioSeries.portfolio_id, MRIPortfolioSeries.lookback, MRIPortfolioSeries.date)
+        ).all()
+        series: dict[tuple[uuid.UUID, int], list[tuple[datetime, float]]] = {
+            (portfolio_id, lookback): [] for portfolio_id in portfolio_ids for lookback in lookbacks
+        }
+        for portfolio_id, lookback, date, value in rows:
+            series[(portfolio_id, lookback)].append((date, value))
+        return series
+
+    series = read()
+    unmaterialized: dict[int, list[uuid.UUID]] = {}
+    for (portfolio_id, lookback), points in series.items():
+        if not points:
+            unmaterialized.setdefault(lookback, []).append(portfolio_id)
+    if unmaterialized:
+        # Same fallback as get_portfolio_series, one fill per lookback for all of its portfolios
+        for lookback, missing_ids in unmaterialized.items():
+            fill_portfolio_series(session=session, portfolio_ids=missing_ids, lookback=lookback)
+        series = read()
+    return series
+
+
+def series_to_arrays(series: Sequence[tuple[datetime, float]]) -> tuple[np.ndarray, np.ndarray]:
+    timestamps = np.fromiter((epoch_seconds(date) for date, _ in series), dtype=np.float64, count=len(series))
+    values = np.fromiter((value for _, value in series), dtype=np.float64, count=len(series))
+    return timestamps, values
+
+
+def _cache_dataset_version(*, session: Session) -> int:
+    global _cached_dataset_version
+
+    dataset_version = get_dataset_version(session=session)
+    if dataset_version != _cached_dataset_version:
+        # New outputs were ingested, nothing cached so far can be served again
+        portfolio_series_cache.invalidate(lambda key: key[3] != dataset_version)
+        _cached_dataset_version = dataset_version
+    return dataset_version
+
+
+def get_cached_portfolio_series(
+    *, session: Session, portfolio: MRIPortfolio, lookback: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the (timestamps, values) of a portfolio series through the
+    in-process cache.
+    """
+    dataset_version = _cache_dataset_version(session=session)
+    key = (portfolio.id, lookback, portfolio.version, dataset_version)
+    cached = portfolio_series_cache.get(key)
+    if cached is None:
+        matrix = mri_matrix.get_matrix(dataset_version=dataset_version)
+        if matrix is not None:
+            timestamps, values = matrix.series(
+                [(asset.asset_class, asset.asset_domain, asset.weight) for asset in portfolio.assets], lookback
+            )
+        else:
+            timestamps, values = series_to_arrays(
+                get_portfolio_series(session=session, portfolio_id=portfolio.id, lookback=lookback)
+            )
+        cached = (timestamps, values)
+        portfolio_series_cache.set(key, cached, size=timestamps.nbytes + values.nbytes)
+    return cached
+
+
+def get_cached_portfolio_analytics(
+    *,
+    session: Session,
+    portfolio: MRIPortfolio,
+    lookback: int,
+    windows: Sequence[int],
+    percentiles: Sequence[float],
+) -> dict[str, np.ndarray]:
+    """
+    Date, Value and the rolling analytics columns of a portfolio series,
+    cached next to the series and invalidated with it.
+    """
+    dataset_version = _cache_dataset_version(session=session)
+    key = (portfolio.id, lookback, portfolio.version, dataset_version, "analytics", tuple(windows), tuple(percentiles))
+    columns = portfolio_series_cache.get(key)
+    if columns is None:
+        timestamps, values = get_cached_portfolio_series(session=session, portfolio=portfolio, lookback=lookback)
+        columns = {"Date": timestamps, "Value": values, **rolling_analytics(values, windows, percentiles)}
+        portfolio_series_cache.set(key, columns, size=sum(column.nbytes for column in columns.values()))
+    return columns
+
+
+def get_weighted_series(
+    *, session: Session, weights: Sequence[tuple[str, str, float]], lookback: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Series of ad-hoc (asset_class, domain, weight) constituents. Served from
+    the asset output matrix when a current snapshot is loaded, otherwise
+    aggregated in the database against an inline VALUES list.
+    """
+    matrix = mri_matrix.get_matrix(dataset_version=get_dataset_version(session=session))
+    if matrix is not None:
+        return matrix.series(weights, lookback)
+
+    weights_table = values(
+        column("asset_class", String), column("domain", String), column("weight", Float), name="weights"
+    ).data(list(weights))
+    series = session.exec(
+        select(cast(MRIAssetOutput.date, DateTime), func.sum(MRIAssetOutput.rpr * weights_table.c.weight))
+        .select_from(weights_table)
+        .join(MRIAsset,
+              (MRIAsset.asset_class == weights_table.c.asset_class) &
+              (MRIAsset.domain == weights_table.c.domain))
+        .join(MRIAssetOutput, MRIAssetOutput.asset_id == MRIAsset.id)
+        .where(MRIAssetOutput.lookback == lookback)
+        .group_by(MRIAssetOutput.date)
+        .order_by(MRIAssetOutput.date)
+    ).all()
+    return series_to_arrays(series)
+
+
+def get_portfolio_contributions(
+    *, session: Session, constituents: Sequence[MRIPortfolioConstituent], lookback: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Timestamps and the (date x constituent) matrix of `rpr * weight`, NaN
+    where a constituent has no output. Dates are those where at least one
+    constituent has an output, like in the portfolio series. Served from the
+    asset output matrix when a current snapshot is loaded, otherwise read
+    in a single query.
+    """
+    contributions: np.ndarray
+    matrix = mri_matrix.get_matrix(dataset_version=get_dataset_version(session=session))
+    if matrix is not None:
+        found = [
+            (i, matrix.asset_index[(constituent.asset_class, constituent.asset_domain)], constituent.weight)
+            for i, constituent in enumerate(constituents)
+            if (constituent.asset_class, constituent.asset_domain) in matrix.asset_index
+        ]
+        positions = np.array([i for i, _, _ in found], dtype=np.intp)
+        columns = np.array([column for _, column, _ in found], dtype=np.intp)
+        weights = np.array([weight for _, _, weight in found], dtype=np.float64)
+        timestamps, outputs, present = matrix.contributions(columns, lookback)
+        contributions = np.full((len(timestamps), len(constituents)), np.nan)
+        contributions[:, positions] = np.where(present, outputs * weights, np.nan)
+        return timestamps, contributions
+
+    rows = session.exec(
+        select(
+            cast(MRIAssetOutput.date, DateTime),
+            MRIPortfolioConstituent.id,
+            MRIAssetOutput.rpr * MRIPortfolioConstituent.weight,
+        )
+        .select_from(MRIPortfolioConstituent)
+        .join(MRIAsset,
+              (MRIAsset.asset_class == MRIPortfolioConstituent.asset_class) &
+              (MRIAsset.domain == MRIPortfolioConstituent.asset_domain))
+        .join(MRIAssetOutput, MRIAssetOutput.asset_id == MRIAsset.id)
+        .where(
+            MRIPortfolioConstituent.id.in_([constituent.id for constituent in constituents]),
+            MRIAssetOutput.lookback == lookback,
+        )
+    ).all()
+    position = {constituent.id: i for i, constituent in enumerate(constituents)}
+    timestamps, date_rows = np.unique(
+        np.fromiter((epoch_seconds(date) for date, _, _ in rows), dtype=np.float64, count=len(rows)),
+        return_inverse=True,
+    )
+    contributions = np.full((len(timestamps), len(constituents)), np.nan)
+    contributions[
+        date_rows, np.fromiter((position[id_] for _, id_, _ in rows), dtype=np.intp, count=len(rows))
+    ] = np.fromiter((value for _, _, value in rows), dtype=np.float64, count=len(rows))
+    return timestamps, contributions
+
+
+def create_portfolios(
+    *, session: Session, portfolios_in: Sequence[PortfolioCreate], user_id: uuid.UUID
+) -> list[tuple[MRIPortfolio, list[MRIPortfolioConstituent]]]:
+    """
+    Insert portfolios and all their constituents with one multi-row
+    INSERT ... RETURNING per table and materialize their series. The
+    caller commits.
+    """
+    if not portfolios_in:
+        return []
+
+    portfolio_rows = [
+        {"id": uuid.uuid4(), "name": portfolio_in.name, "user_id": user_id}
+        for portfolio_in in portfolios_in
+    ]
+    constituent_rows = [
+        {
+            "id": uuid.uuid4(),
+            "portfolio_id": portfolio_row["id"],
+            "asset_name": asset.asset_name,
+            "asset_domain": asset.asset_domain,
+            "asset_class": asset.asset_class,
+            "weight": asset.weight,
+        }
+        for portfolio_row, portfolio_in in zip(portfolio_rows, portfolios_in, strict=True)
+        for asset in portfolio_in.assets
+    ]
+    portfolios = session.scalars(
+        insert(MRIPortfolio).returning(MRIPortfolio, sort_by_parameter_order=True),
+        portfolio_rows,
+    ).all()
+    constituents = session.scalars(
+        insert(MRIPortfolioConstituent).returning(MRIPortfolioConstituent, sort_by_parameter_order=True),
+        constituent_rows,
+    ).all() if constituent_rows else []
+
+    portfolio_ids = [portfolio.id for portfolio in portfolios]
+    rebuild_portfolio_series(session=session, portfolio_ids=portfolio_ids)
+
+    assets: dict[uuid.UUID, list[MRIPortfolioConstituent]] = {portfolio_id: [] for portfolio_id in portfolio_ids}
+    for constituent in constituents:
+        assets[constituent.portfolio_id].append(constituent)
+    return [(portfolio, assets[portfolio.id]) for portfolio in portfolios]
+
+
+def update_portfolio_constituents(
+    *, session: Session, portfolio: MRIPortfolio, assets_in: Sequence[PortfolioConstituentUpdate]
+) -> list[MRIPortfolioConstituent]:
+    """
+    Apply the requested constituent list as a diff against the stored one:
+    entries with an id update that row (only if a field changed), entries
+    without an id are inserted and stored rows missing from the list are
+    deleted. The series is rebuilt and the portfolio version bumped only
+    when something changed. The caller commits.
+    """
+    portfolio_id = portfolio.id
+    existing = {
+        constituent.id: constituent
+        for constituent in session.exec(
+            select(MRIPortfolioConstituent).where(MRIPortfolioConstituent.portfolio_id == portfolio_id)
+        ).all()
+    }
+
+    constituents = []
+    changed = False
+    for asset_in in assets_in:
+        asset_data = asset_in.model_dump(exclude_none=True, exclude={"id"})
+        if asset_in.id is None:
+            missing = {"asset_name", "asset_domain", "asset_class", "weight"} - asset_data.keys()
+            if missing:
+                raise ValueError(f"New constituent is missing {', '.join(sorted(missing))}")
+            constituent = MRIPortfolioConstituent(portfolio_id=portfolio_id, **asset_data)
+            session.add(constituent)
+            changed = True
+        else:
+            constituent = existing.pop(uuid.UUID(asset_in.id), None)
+            if constituent is None:
+                raise ValueError(f"Constituent {asset_in.id} not found in portfolio")
+            for key, value in asset_data.items():
+                if getattr(constituent, key) != value:
+                    setattr(constituent, key, value)
+                    changed = True
+        constituents.append(constituent)
+
+    for constituent in existing.values():
+        session.delete(constituent)
+        changed = True
+
+    # One flush emits the batched INSERT, UPDATE and DELETE statements
+    session.flush()
+    if changed:
+        portfolio.version += 1
+        session.add(portfolio)
+        rebuild_portfolio_series(session=session, portfolio_ids=[portfolio_id])
+        invalidate_portfolio_series(portfolio_id=portfolio_id)
+    return constituents
@@ -3,6 +3,7 @@ import logging
 from sqlmodel import Session
 
 from app.core.db import engine, init_db
+from app.core.partitions import ensure_partitions
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,6 +12,10 @@ logger = logging.getLogger(__name__)
 def init() -> None:
     with Session(engine) as session:
         init_db(session)
+        created = ensure_partitions(session)
+        session.commit()
+        if created:
+            logger.info(f"Created partitions {', '.join(created)}")
 
 
 def main() -> None:
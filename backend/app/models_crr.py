@@ -2,9 +2,11 @@ import uuid
 from datetime import datetime
 from typing import Optional, List, Dict
 
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import DDL, Column, Computed, Float, Index, UniqueConstraint, event
 from sqlmodel import SQLModel, Field, Relationship
 
+from app.core.partitions import default_partition_ddl, partition_by
+
 
 # Models
 
@@ -29,17 +31,98 @@ class CDSPrice(SQLModel, table=True):
     __tablename__ = "cds_prices"
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     security_id: uuid.UUID = Field(foreign_key="crr_securities.id", nullable=False)
-    entry_date: datetime = Field(nullable=False)
+    # Part of the primary key because the table is partitioned on it
+    entry_date: datetime = Field(primary_key=True)
     price: Optional[float] = None
 
+    __table_args__ = (
+        # One price per security and date, covering the history reads of crr.py
+        Index("ix_cds_prices_security_id_entry_date", "security_id", "entry_date",
+              unique=True, postgresql_include=["price"]),
+        {"postgresql_partition_by": partition_by("cds_prices")},
+    )
+
 
 class CRRPrice(SQLModel, table=True):
     __tablename__ = "crr_prices"
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     security_id: uuid.UUID = Field(foreign_key="crr_securities.id", nullable=False)
-    entry_date: datetime = Field(nullable=False)
+    # Part of the primary key because the table is partitioned on it
+    entry_date: datetime = Field(primary_key=True)
     price: Optional[float] = None
 
+    __table_args__ = (
+        # One price per security and date, covering the history reads of crr.py
+        Index("ix_crr_prices_security_id_entry_date", "security_id", "entry_date",
+              unique=True, postgresql_include=["price"]),
+        {"postgresql_partition_by": partition_by("crr_prices")},
+    )
+
+
+event.listen(CDSPrice.__table__, "after_create", default_partition_ddl("cds_prices"))
+event.listen(CRRPrice.__table__, "after_create", default_partition_ddl("crr_prices"))
+
+
+class CRRLatestPrice(SQLModel, table=True):
+    __tablename__ = "crr_latest_prices"  # Latest CDS and CRR price per security, kept current by triggers
+    security_id: uuid.UUID = Field(foreign_key="crr_securities.id", primary_key=True, ondelete="CASCADE")
+    cds_price: Optional[float] = None
+    cds_date: Optional[datetime] = None
+    crr_price: Optional[float] = None
+    crr_date: Optional[datetime] = None
+    # Bumped on every write to either price history of the security
+    version: int = Field(default=0, nullable=False)
+    spread: Optional[float] = Field(default=None, sa_column=Column(Float, Computed(
+        "CASE WHEN cds_price <> 0 AND crr_price <> 0 "
+        "THEN round((cds_price - crr_price)::numeric, 2)::double precision END"
+    )))
+
+
+def latest_price_trigger_ddl(table: str, prefix: str) -> list[str]:
+    """
+    Function and trigger keeping the `<prefix>_price` and `<prefix>_date`
+    columns of crr_latest_prices on the latest entry of `table`. Inserts
+    only move an entry forward; deletes and updates re-read the latest
+    entry of the security they took a row from. Every write bumps the
+    version of the security.
+    """
+    function = f"crr_latest_prices_{prefix}"
+    newer = f"crr_latest_prices.{prefix}_date IS NULL OR crr_latest_prices.{prefix}_date <= EXCLUDED.{prefix}_date"
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE crr_latest_prices SET ({prefix}_price, {prefix}_date) = (
+                    SELECT price, entry_date FROM {table}
+                    WHERE security_id = OLD.security_id ORDER BY entry_date DESC LIMIT 1
+                ), version = version + 1
+                WHERE security_id = OLD.security_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO crr_latest_prices (security_id, {prefix}_price, {prefix}_date, version)
+                VALUES (NEW.security_id, NEW.price, NEW.entry_date, 1)
+                ON CONFLICT (security_id) DO UPDATE
+                SET {prefix}_price = CASE WHEN {newer} THEN EXCLUDED.{prefix}_price ELSE crr_latest_prices.{prefix}_price END,
+                    {prefix}_date = CASE WHEN {newer} THEN EXCLUDED.{prefix}_date ELSE crr_latest_prices.{prefix}_date END,
+                    version = crr_latest_prices.version + 1;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        f"""
+        CREATE TRIGGER {table}_latest_price AFTER INSERT OR UPDATE OR DELETE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION {function}()
+        """,
+    ]
+
+
+# Row triggers on the partitioned tables are cloned onto every partition
+for _table, _prefix in ((CDSPrice.__table__, "cds"), (CRRPrice.__table__, "crr")):
+    for _statement in latest_price_trigger_ddl(_table.name, _prefix):
+        event.listen(_table, "after_create", DDL(_statement))
+
 
 class CRRPortfolioConstituent(SQLModel, table=True):
     __tablename__ = "crr_portfolio_constituents"
@@ -1,9 +1,15 @@
 import uuid
-from datetime import datetime
+from datetime import date as date_, datetime
 from typing import Optional, List, Dict
 
+from sqlalchemy import DDL, SmallInteger, UniqueConstraint, event
 from sqlmodel import SQLModel, Field, Relationship
 
+from app.core.partitions import default_partition_ddl, partition_by
+
+# Portfolio shared with every user, owned by the nil user id
+DEFAULT_PORTFOLIO_ID = uuid.UUID("00000000-0000-0000-0000-000000000000")
+
 
 # Models
 
@@ -12,6 +18,8 @@ class MRIPortfolio(SQLModel, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     name: str = Field(index=True, max_length=255)
     user_id: uuid.UUID = Field(index=True, nullable=False)
+    # Bumped whenever the constituents change
+    version: int = Field(default=1, nullable=False)
 
     assets: list["MRIPortfolioConstituent"] = Relationship(back_populates="portfolio")
 
@@ -28,14 +36,59 @@ class MRIPortfolioConstituent(SQLModel, table=True):
     portfolio: MRIPortfolio = Relationship(back_populates="assets")
 
 
+class MRIAsset(SQLModel, table=True):
+    __tablename__ = "mri_assets"  # Catalog of (asset_class, domain) pairs with outputs
+    id: Optional[int] = Field(default=None, primary_key=True, sa_type=SmallInteger)
+    asset_class: str = Field(max_length=255, nullable=False)
+    domain: str = Field(max_length=255, nullable=False)
+
+    __table_args__ = (UniqueConstraint("asset_class", "domain"),)
+
+
 class MRIAssetOutput(SQLModel, table=True):
     __tablename__ = "mri_asset_outputs"  # Explicit table name
-    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    date: datetime = Field(nullable=False)
-    domain: str = Field(max_length=255, nullable=False)
-    asset_class: str = Field(max_length=255, nullable=False)  # Renamed from `class_`
+    asset_id: int = Field(foreign_key="mri_assets.id", primary_key=True, sa_type=SmallInteger)
+    lookback: int = Field(primary_key=True, sa_type=SmallInteger)
+    date: date_ = Field(primary_key=True)
     rpr: float = Field(nullable=False)
-    lookback: int = Field(nullable=False)
+
+    __table_args__ = {"postgresql_partition_by": partition_by("mri_asset_outputs")}
+
+
+# SQLAlchemy cannot emit INCLUDE on a primary key. Covering rpr lets the
+# portfolio aggregation run as an index-only scan.
+event.listen(
+    MRIAssetOutput.__table__,
+    "after_create",
+    DDL(
+        "ALTER TABLE mri_asset_outputs DROP CONSTRAINT mri_asset_outputs_pkey, "
+        "ADD CONSTRAINT mri_asset_outputs_pkey PRIMARY KEY (asset_id, lookback, date) INCLUDE (rpr)"
+    ),
+)
+event.listen(MRIAssetOutput.__table__, "after_create", default_partition_ddl("mri_asset_outputs"))
+
+
+class MRIDatasetVersion(SQLModel, table=True):
+    __tablename__ = "mri_dataset_version"  # Single row, bumped on every asset output ingest
+    id: int = Field(default=1, primary_key=True)
+    version: int = Field(default=0, nullable=False)
+
+
+class MRIIngestManifest(SQLModel, table=True):
+    __tablename__ = "mri_ingest_manifest"  # One row per asset output file loaded by the seeder
+    file_path: str = Field(primary_key=True, max_length=1024)
+    checksum: str = Field(max_length=64, nullable=False)  # SHA-256 of the file contents
+    max_date: datetime = Field(nullable=False)
+    rows: int = Field(nullable=False)
+    ingested_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+class MRIPortfolioSeries(SQLModel, table=True):
+    __tablename__ = "mri_portfolio_series"  # Materialized portfolio time series
+    portfolio_id: uuid.UUID = Field(foreign_key="mri_portfolios.id", primary_key=True, ondelete="CASCADE")
+    lookback: int = Field(primary_key=True)
+    date: datetime = Field(primary_key=True)
+    value: float = Field(nullable=False)
 
 
 # Request and Response Models
@@ -58,6 +111,43 @@ class PortfolioResponse(SQLModel):
     time_series: Optional[List[Dict[str, float]]] = []
 
 
+class PortfolioBatchResponse(SQLModel):
+    # portfolio id -> lookback -> time series
+    series: Dict[str, Dict[int, List[Dict[str, float]]]]
+
+
+class PortfolioAnalyticsResponse(SQLModel):
+    lookback: int
+    max_drawdown: Optional[float]
+    # Column name -> values aligned with the "Date" column, null until a window is full
+    series: Dict[str, List[Optional[float]]]
+
+
+class PortfolioContributionsResponse(SQLModel):
+    lookback: int
+    assets: List[PortfolioConstituentResponse]
+    # "Date" and one column per constituent id, null where the constituent has no output
+    contributions: Dict[str, List[Optional[float]]]
+
+
+class WhatIfResponse(SQLModel):
+    lookback: int
+    time_series: List[Dict[str, float]]
+
+
+# Requests
+
+class PortfolioBatchRequest(SQLModel):
+    portfolio_ids: List[uuid.UUID] = Field(min_length=1, max_length=100)
+    lookbacks: List[int] = Field(min_length=1, max_length=10)
+
+
+class WhatIfRequest(SQLModel):
+    # Ad-hoc weights, not saved as a portfolio
+    assets: List["PortfolioConstituentCreate"] = Field(min_length=1, max_length=1000)
+    lookback: int
+
+
 # Creates
 
 class PortfolioConstituentCreate(SQLModel):
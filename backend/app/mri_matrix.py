@@ -0,0 +1,194 @@
+"""
+Dense in-memory view of `mri_asset_outputs`.
+
+The outputs form a (lookback x date x asset) matrix. A snapshot of it is
+written to disk as `.npy` files after every ingest and memory-mapped by the
+API processes, so a portfolio series becomes a matrix-vector product
+instead of a database aggregation.
+"""
+import json
+import shutil
+import threading
+import uuid
+from collections.abc import Sequence
+from datetime import datetime, time
+from pathlib import Path
+
+import numpy as np
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.models_mri import MRIAsset, MRIAssetOutput
+from app.timeseries import epoch_seconds
+
+CURRENT = "CURRENT"
+
+
+class AssetOutputMatrix:
+    def __init__(
+        self,
+        *,
+        values: np.ndarray,
+        timestamps: np.ndarray,
+        lookbacks: list[int],
+        assets: list[tuple[str, str]],
+        dataset_version: int,
+    ) -> None:
+        self.values = values  # (lookback, date, asset), NaN where there is no output
+        self.timestamps = timestamps
+        self.dataset_version = dataset_version
+        self.lookback_index = {lookback: i for i, lookback in enumerate(lookbacks)}
+        self.asset_index = {asset: i for i, asset in enumerate(assets)}
+
+    @classmethod
+    def load(cls, directory: Path) -> "AssetOutputMatrix | None":
+        try:
+            snapshot = directory / (directory / CURRENT).read_text().strip()
+            meta = json.loads((snapshot / "meta.json").read_text())
+            return cls(
+                values=np.load(snapshot / "values.npy", mmap_mode="r"),
+                timestamps=np.load(snapshot / "timestamps.npy", mmap_mode="r"),
+                lookbacks=meta["lookbacks"],
+                assets=[tuple(asset) for asset in meta["assets"]],
+                dataset_version=meta["dataset_version"],
+            )
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+    def weight_vector(self, weights: Sequence[tuple[str, str, float]]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Matrix column indices and summed weights of (asset_class, domain, weight)
+        constituents. Assets without outputs are dropped, like in the SQL join.
+        """
+        columns: dict[int, float] = {}
+        for asset_class, domain, weight in weights:
+            column = self.asset_index.get((asset_class, domain))
+            if column is not None:
+                columns[column] = columns.get(column, 0.0) + weight
+        return np.fromiter(columns.keys(), dtype=np.intp), np.fromiter(columns.values(), dtype=np.float64)
+
+    def contributions(
+        self, columns: np.ndarray, lookback: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Outputs of the given columns at one lookback, restricted to the dates
+        where at least one of them has a value, with missing values as 0.
+        Returns (timestamps, outputs, present mask).
+        """
+        lookback_row = self.lookback_index.get(lookback)
+        if lookback_row is None or not len(columns):
+            return np.empty(0), np.empty((0, len(columns))), np.empty((0, len(columns)), dtype=bool)
+        outputs = self.values[lookback_row][:, columns]
+        present = ~np.isnan(outputs)
+        keep = present.any(axis=1)
+        outputs, present = outputs[keep], present[keep]
+        outputs[~present] = 0.0
+        return np.asarray(self.timestamps[keep]), outputs, present
+
+    def series(
+        self, weights: Sequence[tuple[str, str, float]], lookback: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        columns, weight_values = self.weight_vector(weights)
+        timestamps, outputs, _ = self.contributions(columns, lookback)
+        return timestamps, outputs @ weight_values
+
+
+def write_snapshot(*, session: Session, directory: Path, dataset_version: int) -> Path:
+    """
+    Dump all asset outputs into a new snapshot directory and atomically
+    point CURRENT at it. Previous snapshots are removed. Works with plain
+    SQLAlchemy sessions too, so the seeder can call it after an ingest.
+    """
+    catalog = session.execute(
+        select(MRIAsset.id, MRIAsset.asset_class, MRIAsset.domain).order_by(MRIAsset.id)
+    ).all()
+    assets = [(asset_class, domain) for _, asset_class, domain in catalog]
+    lookbacks = list(session.scalars(select(MRIAssetOutput.lookback).distinct().order_by(MRIAssetOutput.lookback)))
+    dates = list(session.scalars(select(MRIAssetOutput.date).distinct().order_by(MRIAssetOutput.date)))
+    date_index = {date: i for i, date in enumerate(dates)}
+    lookback_index = {lookback: i for i, lookback in enumerate(lookbacks)}
+
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"snapshot-{dataset_version}-{uuid.uuid4().hex}"
+    snapshot = directory / name
+    snapshot.mkdir()
+
+    values = np.lib.format.open_memmap(
+        snapshot / "values.npy", mode="w+", dtype=np.float64, shape=(len(lookbacks), len(dates), len(assets))
+    )
+    values[:] = np.nan
+    for column, (asset_id, _, _) in enumerate(catalog):
+        # One index-only scan per asset on the primary key
+        rows = session.execute(
+            select(MRIAssetOutput.lookback, MRIAssetOutput.date, MRIAssetOutput.rpr)
+            .where(MRIAssetOutput.asset_id == asset_id)
+        ).all()
+        if rows:
+            lookback_rows = np.fromiter((lookback_index[row[0]] for row in rows), dtype=np.intp, count=len(rows))
+            date_rows = np.fromiter((date_index[row[1]] for row in rows), dtype=np.intp, count=len(rows))
+            values[lookback_rows, date_rows, column] = np.fromiter((row[2] for row in rows), dtype=np.float64)
+    values.flush()
+    del values
+
+    timestamps = (epoch_seconds(datetime.combine(date, time())) for date in dates)
+    np.save(snapshot / "timestamps.npy", np.fromiter(timestamps, dtype=np.float64))
+    (snapshot / "meta.json").write_text(json.dumps({
+        "dataset_version": dataset_version,
+        "lookbacks": lookbacks,
+        "assets": assets,
+    }))
+
+    pointer = directory / f"{CURRENT}.{name}"
+    pointer.write_text(name)
+    pointer.replace(directory / CURRENT)
+
+    for path in directory.iterdir():
+        if path.is_dir() and path.name != name:
+            shutil.rmtree(path, ignore_errors=True)
+    return snapshot
+
+
+_matrix: AssetOutputMatrix | None = None
+# (dataset version, snapshot pointer) of the last lookup that found no usable
+# snapshot, so requests don't take the lock and reload until one is written
+_miss: tuple[int, tuple[Path, int | None]] | None = None
+_lock = threading.Lock()
+
+
+def _snapshot_pointer(directory: Path) -> tuple[Path, int | None]:
+    """
+    The snapshot directory and the modification time of its CURRENT pointer,
+    which write_snapshot replaces with every new snapshot.
+    """
+    try:
+        return directory, (directory / CURRENT).stat().st_mtime_ns
+    except FileNotFoundError:
+        return directory, None
+
+
+def get_matrix(*, dataset_version: int) -> AssetOutputMatrix | None:
+    """
+    The process-wide matrix, (re)loaded from the snapshot directory when the
+    loaded one is older than the dataset. None when no snapshot of the
+    current dataset version is available.
+    """
+    global _matrix, _miss
+
+    matrix = _matrix
+    if matrix is not None and matrix.dataset_version == dataset_version:
+        return matrix
+    directory = Path(settings.MRI_SNAPSHOT_DIR)
+    miss = (dataset_version, _snapshot_pointer(directory))
+    if _miss == miss:
+        return None
+    with _lock:
+        matrix = _matrix
+        if matrix is not None and matrix.dataset_version == dataset_version:
+            return matrix
+        if _miss != miss:
+            matrix = AssetOutputMatrix.load(directory)
+            if matrix is not None and matrix.dataset_version == dataset_version:
+                _matrix, _miss = matrix, None
+                return matrix
+            _matrix, _miss = None, miss
+        return None
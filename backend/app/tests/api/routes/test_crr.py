@@ -1,10 +1,22 @@
 import uuid
 import datetime
+import json
+import msgpack
+import numpy as np
+import pyarrow as pa
 import pytest
-from sqlmodel import Session
+from typing import Any
+from sqlmodel import Session, select, text
 from starlette.testclient import TestClient
 from app.models_crr import CRRPortfolioConstituent, CRRSecurity, CDSPrice, CRRPrice, CRRMerton
 from app.core.config import settings
+from app.core.db import engine
+from app.core.partitions import ensure_partitions
+from app.api.responses import ARROW_STREAM, MSGPACK, NDJSON
+from app.api.routes import crr
+from app.api.routes.crr import spread_regions
+from app.tests.utils.utils import count_queries
+from app.timeseries import epoch_seconds
 
 
 @pytest.fixture(autouse=True)
@@ -41,6 +53,40 @@ def test_get_portfolio(client: TestClient, superuser_token_headers: dict[str, st
     assert data[0]["name"] == "TEST"
 
 
+def test_get_portfolio_latest_prices_in_one_query(client: TestClient, superuser_token_headers: dict[str, str], db: Session) -> None:
+    user_id = "00000000-6666-0000-0000-000000000000"
+
+    def add_securities(count: int) -> None:
+        for _ in range(count):
+            security = CRRSecurity(ticker_bbg=f"LATEST {uuid.uuid4()}")
+            db.add(security)
+            db.flush()
+            db.add(CRRPortfolioConstituent(user_id=user_id, security_id=security.id, sensitivity=1.0))
+            db.add_all([
+                CRRPrice(security_id=security.id, entry_date=datetime.datetime(2020, 1, day), price=90.0 + day)
+                for day in (1, 2, 3)
+            ])
+            db.add_all([
+                CDSPrice(security_id=security.id, entry_date=datetime.datetime(2020, 1, day), price=100.0 + day)
+                for day in (1, 2)
+            ])
+        db.commit()
+
+    def get_portfolio() -> tuple[list[dict[str, Any]], int]:
+        with count_queries(engine) as queries:
+            response = client.get(f"{settings.API_V1_STR}/crr/portfolio/", headers=superuser_token_headers)
+        assert response.status_code == 200
+        return response.json(), len(queries)
+
+    add_securities(2)
+    data, queries_for_two = get_portfolio()
+    assert [(entry["cds_price"], entry["crr_price"], entry["spread"]) for entry in data] == [(102.0, 93.0, 9.0)] * 2
+    add_securities(20)
+    data, queries_for_twenty_two = get_portfolio()
+    assert len(data) == 22
+    assert queries_for_twenty_two == queries_for_two
+
+
 def test_add_security_to_portfolio(client: TestClient, superuser_token_headers: dict[str, str], db: Session) -> None:
     security_id = uuid.uuid4()
     security = CRRSecurity(id=security_id, ticker_bbg="TEST")
@@ -134,6 +180,122 @@ def test_calculate_spread_analysis(client: TestClient, superuser_token_headers:
     assert "deviation" in data
 
 
+def reference_spread_regions(
+        dates: list[datetime.datetime], rolling: list[float], std_dev: float
+) -> list[tuple[str, datetime.datetime, datetime.datetime]]:
+    regions = []
+    first_green, first_red = None, None
+    for date, value in zip(dates, rolling, strict=True):
+        if value > std_dev:
+            if first_green is None:
+                first_green = date
+        elif first_green:
+            regions.append(("positive", first_green, date - datetime.timedelta(days=1)))
+            first_green = None
+
+        if value < -std_dev:
+            if first_red is None:
+                first_red = date
+        elif first_red:
+            regions.append(("negative", first_red, date - datetime.timedelta(days=1)))
+            first_red = None
+    return regions
+
+
+def test_spread_regions_match_row_loop() -> None:
+    rng = np.random.default_rng(0)
+    dates = [datetime.datetime(2000, 1, 1) + datetime.timedelta(days=day) for day in range(3000)]
+    rolling = np.convolve(rng.normal(size=3000), np.ones(20) / 20, mode="same")
+    for std_dev in (0.0, 0.05, 0.1, -0.05):
+        regions = spread_regions(np.array(dates, dtype="datetime64[us]"), rolling, std_dev)
+        assert [(region.spread, region.x1, region.x2) for region in regions] == \
+            reference_spread_regions(dates, rolling.tolist(), std_dev)
+        assert regions
+
+
+@pytest.fixture(params=["pandas", "sql"])
+def spread_engine(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> str:
+    name: str = request.param
+    monkeypatch.setattr(settings, "SPREAD_ANALYSIS_ENGINE", name)
+    return name
+
+
+@pytest.mark.usefixtures("spread_engine")
+def test_calculate_spread_analysis_regions(client: TestClient, superuser_token_headers: dict[str, str],
+                                           db: Session) -> None:
+    security_id = uuid.uuid4()
+    db.add(CRRSecurity(id=security_id, ticker_bbg="REGIONS"))
+    db.commit()
+    spreads = [0, 0, 5, 5, 5, 0, -5, -5, 0, 0, 5, 5]
+    dates = [datetime.datetime(2020, 1, 1) + datetime.timedelta(days=day) for day in range(len(spreads))]
+    db.add_all([CDSPrice(security_id=security_id, entry_date=date, price=100.0 + spread)
+                for date, spread in zip(dates, spreads, strict=True)])
+    # No CRR price on the last date, it is not part of the analysis
+    db.add_all([CRRPrice(security_id=security_id, entry_date=date, price=100.0) for date in dates[:-1]])
+    db.commit()
+
+    response = client.get(f"{settings.API_V1_STR}/crr/spread/{security_id}/", headers=superuser_token_headers,
+                          params={"days": 1, "deviation": 1})
+    assert response.status_code == 200
+    data = response.json()
+    rolling = np.array(spreads[:-1], dtype=np.float64)
+    assert data["deviation"] == pytest.approx(rolling.std(ddof=1))
+    # The positive run open at the last date is left out
+    assert data["regions"] == [
+        {"spread": "positive", "x1": "2020-01-03T00:00:00", "x2": "2020-01-05T00:00:00"},
+        {"spread": "negative", "x1": "2020-01-07T00:00:00", "x2": "2020-01-08T00:00:00"},
+    ]
+
+    # Dates before the first full window count as a rolling mean of 0
+    response = client.get(f"{settings.API_V1_STR}/crr/spread/{security_id}/", headers=superuser_token_headers,
+                          params={"days": 3, "deviation": 1})
+    rolling = np.convolve(spreads[:-1], np.ones(3) / 3, mode="valid")
+    assert response.json()["deviation"] == pytest.approx(np.concatenate([[0, 0], rolling]).std(ddof=1))
+
+    response = client.get(f"{settings.API_V1_STR}/crr/spread/{uuid.uuid4()}/", headers=superuser_token_headers,
+                          params={"days": 3, "deviation": 1})
+    assert response.json() == {"regions": [], "deviation": 0.0}
+
+    response = client.get(f"{settings.API_V1_STR}/crr/spread/{security_id}/", headers=superuser_token_headers,
+                          params={"days": 0, "deviation": 1})
+    assert response.status_code == 422
+
+
+def test_spread_analysis_engines_agree(client: TestClient, superuser_token_headers: dict[str, str], db: Session,
+                                       monkeypatch: pytest.MonkeyPatch) -> None:
+    security_id = uuid.uuid4()
+    db.add(CRRSecurity(id=security_id, ticker_bbg="ENGINES"))
+    db.commit()
+    rng = np.random.default_rng(0)
+    dates = [datetime.datetime(2000, 1, 1) + datetime.timedelta(days=day) for day in range(1500)]
+    crr_prices = 100 + np.cumsum(rng.normal(size=len(dates)))
+    cds_prices = crr_prices + np.cumsum(rng.normal(scale=0.5, size=len(dates)))
+    # Gaps on either side and missing prices
+    db.add_all([
+        CDSPrice(security_id=security_id, entry_date=date, price=None if day % 97 == 0 else price)
+        for day, (date, price) in enumerate(zip(dates, cds_prices.tolist(), strict=True)) if day % 31
+    ])
+    db.add_all([
+        CRRPrice(security_id=security_id, entry_date=date, price=price)
+        for day, (date, price) in enumerate(zip(dates, crr_prices.tolist(), strict=True)) if day % 43
+    ])
+    db.commit()
+
+    def analysis(engine: str, days: int, deviation: int) -> dict[str, Any]:
+        monkeypatch.setattr(settings, "SPREAD_ANALYSIS_ENGINE", engine)
+        response = client.get(f"{settings.API_V1_STR}/crr/spread/{security_id}/", headers=superuser_token_headers,
+                              params={"days": days, "deviation": deviation})
+        assert response.status_code == 200
+        return response.json()
+
+    for days, deviation in ((1, 1), (5, 1), (21, 1), (21, 2), (63, 0)):
+        from_pandas = analysis("pandas", days, deviation)
+        from_sql = analysis("sql", days, deviation)
+        assert from_sql["regions"] == from_pandas["regions"]
+        assert len(from_sql["regions"]) > 1
+        assert from_sql["deviation"] == pytest.approx(from_pandas["deviation"])
+
+
 def test_get_security_data(client: TestClient, superuser_token_headers: dict[str, str], db: Session) -> None:
     security_id = uuid.uuid4()
     security = CRRSecurity(id=security_id, ticker_bbg="TEST")
@@ -167,6 +329,55 @@ def test_get_security_data(client: TestClient, superuser_token_headers: dict[str
     assert len(data["crr"]) == len(data["cds"])
 
 
+def test_get_security_data_conditional_get(client: TestClient, superuser_token_headers: dict[str, str], db: Session) -> None:
+    security_id = uuid.uuid4()
+    db.add(CRRSecurity(id=security_id, ticker_bbg="ETAG"))
+    db.commit()
+    db.add(CRRPrice(security_id=security_id, entry_date=datetime.datetime(2020, 1, 1), price=90.0))
+    db.add(CDSPrice(security_id=security_id, entry_date=datetime.datetime(2020, 1, 1), price=100.0))
+    db.commit()
+    url = f"{settings.API_V1_STR}/crr/security/{security_id}/"
+
+    response = client.get(url, headers=superuser_token_headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    response = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    # Other representations have their own tag
+    response = client.get(url, headers={**superuser_token_headers, "Accept": MSGPACK, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+    # New prices change the tag
+    db.add(CRRPrice(security_id=security_id, entry_date=datetime.datetime(2020, 1, 2), price=91.0))
+    db.commit()
+    response = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert len(response.json()["crr"]) == 2
+
+    # So do corrections, backfills and deletes, which leave the row count or the latest date alone
+    def revalidate() -> str:
+        response = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        return response.headers["etag"]
+
+    etag = response.headers["etag"]
+    db.exec(text(f"UPDATE crr_prices SET price = 95.0 WHERE security_id = '{security_id}' AND price = 90.0"))
+    db.commit()
+    etag = revalidate()
+    assert client.get(url, headers=superuser_token_headers).json()["crr"][0]["value"] == 95.0
+    db.add(CDSPrice(security_id=security_id, entry_date=datetime.datetime(2019, 12, 31), price=99.0))
+    db.commit()
+    etag = revalidate()
+    db.exec(text(f"DELETE FROM cds_prices WHERE security_id = '{security_id}' AND price = 99.0"))
+    db.commit()
+    revalidate()
+
+
 def test_search_securities(client: TestClient, superuser_token_headers: dict[str, str], db: Session) -> None:
     # Create and add a test security to the database
     security_id = uuid.uuid4()
@@ -236,3 +447,128 @@ def test_get_merton_data(client: TestClient, superuser_token_headers: dict[str,
     assert "probability_of_survival" in data
     assert len(data["price"]) == len(data["cds_delta"])
 
+
+
+@pytest.mark.usefixtures("local_time_zone")
+def test_get_security_data_binary_formats(client: TestClient, superuser_token_headers: dict[str, str], db: Session) -> None:
+    security_id = uuid.uuid4()
+    db.add(CRRSecurity(id=security_id, ticker_bbg="TEST"))
+    db.commit()
+    dates = [datetime.datetime(2020, 1, day) for day in (1, 2, 3)]
+    db.add_all([CRRPrice(security_id=security_id, entry_date=date, price=90.0 + i) for i, date in enumerate(dates)])
+    db.add_all([CDSPrice(security_id=security_id, entry_date=date, price=100.0 + i) for i, date in enumerate(dates[1:])])
+    db.commit()
+
+    response = client.get(
+        f"{settings.API_V1_STR}/crr/security/{security_id}/",
+        headers={**superuser_token_headers, "Accept": ARROW_STREAM},
+    )
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column("date").to_pylist() == [int(epoch_seconds(date)) for date in dates]
+    assert table.column("crr").to_pylist() == [90.0, 91.0, 92.0]
+    assert table.column("cds").to_pylist() == [None, 100.0, 101.0]
+
+    response = client.get(
+        f"{settings.API_V1_STR}/crr/security/{security_id}/",
+        headers={**superuser_token_headers, "Accept": MSGPACK},
+    )
+    payload = msgpack.unpackb(response.content)
+    assert payload["cds"] == [None, 100.0, 101.0]
+
+    # JSON dates are the same UTC epoch seconds
+    response = client.get(f"{settings.API_V1_STR}/crr/security/{security_id}/", headers=superuser_token_headers)
+    assert [entry["date"] for entry in response.json()["crr"]] == [int(epoch_seconds(date)) for date in dates]
+
+
+@pytest.mark.usefixtures("local_time_zone")
+def test_get_security_data_ndjson_stream(client: TestClient, superuser_token_headers: dict[str, str], db: Session,
+                                         monkeypatch: pytest.MonkeyPatch) -> None:
+    security_id = uuid.uuid4()
+    db.add(CRRSecurity(id=security_id, ticker_bbg="TEST"))
+    db.commit()
+    dates = [datetime.datetime(2020, 1, day) for day in (1, 2, 3)]
+    db.add_all([CRRPrice(security_id=security_id, entry_date=date, price=90.0 + i) for i, date in enumerate(dates)])
+    db.add_all([CDSPrice(security_id=security_id, entry_date=date, price=100.0 + i) for i, date in enumerate(dates[1:])])
+    db.commit()
+    monkeypatch.setattr(crr, "PRICE_STREAM_BATCH_SIZE", 2)
+
+    response = client.get(
+        f"{settings.API_V1_STR}/crr/security/{security_id}/",
+        headers={**superuser_token_headers, "Accept": NDJSON},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == NDJSON
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"date": int(epoch_seconds(date)), "crr": crr_price, "cds": cds_price}
+        for date, crr_price, cds_price in zip(dates, [90.0, 91.0, 92.0], [None, 100.0, 101.0], strict=True)
+    ]
+
+
+def test_get_merton_data_binary_formats(client: TestClient, superuser_token_headers: dict[str, str], db: Session) -> None:
+    security_id = uuid.uuid4()
+    db.add(CRRSecurity(id=security_id, ticker_bbg="TEST"))
+    db.commit()
+    date = datetime.datetime(2020, 1, 1)
+    db.add(CRRMerton(id=security_id, cds_period=1, entry_date=date, cds_delta=0.1, ps=0.9))
+    db.add(CDSPrice(security_id=security_id, entry_date=date, price=100.0))
+    db.commit()
+
+    response = client.get(
+        f"{settings.API_V1_STR}/crr/merton-data/",
+        headers={**superuser_token_headers, "Accept": ARROW_STREAM},
+        params={"id": str(security_id), "period": 1},
+    )
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.to_pydict() == {
+        "date": [int(epoch_seconds(date))],
+        "cds_delta": [0.1],
+        "probability_of_survival": [0.9],
+        "price": [100.0],
+    }
+
+
+def test_price_history_reads_use_security_date_index(client: TestClient, superuser_token_headers: dict[str, str], db: Session) -> None:
+    # 50 securities x 730 days in the 2000 - 2001 partitions
+    ensure_partitions(db, years=range(2000, 2002))
+    db.execute(text("""
+        INSERT INTO crr_securities (id, ticker_bbg)
+        SELECT gen_random_uuid(), 'INDEXED ' || s FROM generate_series(0, 49) s
+    """))
+    for table in ("cds_prices", "crr_prices"):
+        db.execute(text(f"""
+            INSERT INTO {table} (id, security_id, entry_date, price)
+            SELECT gen_random_uuid(), securities.id, TIMESTAMP '2000-01-01' + d * INTERVAL '1 day', random()
+            FROM crr_securities securities, generate_series(0, 729) d
+            WHERE securities.ticker_bbg LIKE 'INDEXED %'
+        """))
+    db.commit()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("VACUUM ANALYZE cds_prices, crr_prices"))
+    security_id = db.exec(select(CRRSecurity.id).where(CRRSecurity.ticker_bbg == "INDEXED 0")).one()
+
+    with count_queries(engine) as queries:
+        for url in (
+            f"/crr/security/{security_id}/",
+            f"/crr/spread/{security_id}/?days=5&deviation=1",
+            f"/crr/merton-data/?id={security_id}&period=5",
+        ):
+            response = client.get(f"{settings.API_V1_STR}{url}", headers=superuser_token_headers)
+            assert response.status_code == 200, response.text
+    statements = [
+        (statement, parameters) for statement, parameters in queries
+        if "cds_prices" in statement or "crr_prices" in statement
+    ]
+
+    assert len(statements) >= 5
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = "\n".join(row[0] for row in connection.exec_driver_sql(f"EXPLAIN {statement}", parameters))
+            # Empty partitions of other years may be scanned sequentially at no cost
+            for table in ("cds_prices", "crr_prices"):
+                if table not in statement:
+                    continue
+                for year in (2000, 2001):
+                    assert f"{table}_y{year}_security_id_entry_date" in plan, plan
+                    assert f"Seq Scan on {table}_y{year}" not in plan, plan
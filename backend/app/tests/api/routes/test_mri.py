@@ -1,10 +1,22 @@
 import datetime
+import json
+from pathlib import Path
 from uuid import UUID
 
+import msgpack
+import pyarrow as pa
 import pytest
+from app import crud_mri, mri_matrix
+from app.api import responses
+from app.api.responses import ARROW_STREAM, MSGPACK, NDJSON
+from app.api.routes import mri as mri_routes
 from app.core.config import settings
-from app.models_mri import MRIPortfolio, MRIPortfolioConstituent, MRIAssetOutput
-from sqlmodel import Session
+from app.core.db import engine
+from app.models_mri import MRIPortfolio, MRIPortfolioConstituent, MRIPortfolioSeries
+from app.tests.utils.mri import asset_output
+from app.timeseries import epoch_seconds
+from app.tests.utils.utils import count_queries
+from sqlmodel import Session, select
 from starlette.testclient import TestClient
 
 
@@ -13,6 +25,9 @@ def clear_db(db: Session):
     db.query(MRIPortfolioConstituent).delete()
     db.query(MRIPortfolio).delete()
     db.commit()
+    # Portfolios deleted behind the API's back, drop what was kept for them
+    crud_mri.portfolio_series_cache.clear()
+    mri_routes._default_portfolio = None
 
 
 def test_default_portfolio_time_series(
@@ -44,14 +59,16 @@ def test_default_portfolio_time_series(
     db.commit()
 
     # Create asset output data
-    asset_output1 = MRIAssetOutput(
+    asset_output1 = asset_output(
+        db,
         date=datetime.datetime.utcnow(),
         domain="Domain 1",
         asset_class="Class 1",
         rpr=100.0,
         lookback=252
     )
-    asset_output2 = MRIAssetOutput(
+    asset_output2 = asset_output(
+        db,
         date=datetime.datetime.utcnow(),
         domain="Domain 2",
         asset_class="Class 2",
@@ -131,6 +148,42 @@ def test_get_default_portfolio(
     assert data["id"] == str(portfolio.id)
 
 
+def test_default_portfolio_is_served_precomputed(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    default_portfolio_user_id = UUID("00000000-0000-0000-0000-000000000000")
+    portfolio = MRIPortfolio(id=default_portfolio_user_id, name="Default Portfolio", user_id=default_portfolio_user_id)
+    db.add(portfolio)
+    db.commit()
+    db.add(MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name="Warm Asset", asset_domain="Warm Domain",
+                                   asset_class="Warm Class", weight=1.0))
+    db.add(asset_output(db, date=datetime.datetime(2002, 1, 2), domain="Warm Domain", asset_class="Warm Class",
+                        rpr=1.0, lookback=252))
+    db.commit()
+    url = f"{settings.API_V1_STR}/mri/default-portfolio"
+
+    # Startup precomputes the response
+    assert mri_routes.warm_default_portfolio(db) is not None
+
+    with count_queries(engine) as queries:
+        response = client.get(url, headers=superuser_token_headers)
+    assert response.status_code == 200
+    assert response.json()["time_series"] == [{"Date": epoch_seconds(datetime.datetime(2002, 1, 2)), "Value": 1.0}]
+    # Only the version lookups, no series query
+    assert not any("mri_asset_outputs" in statement or "mri_portfolio_series" in statement
+                   for statement, _ in queries), queries
+
+    # An ingest makes the kept response stale
+    db.add(asset_output(db, date=datetime.datetime(2002, 1, 3), domain="Warm Domain", asset_class="Warm Class",
+                        rpr=2.0, lookback=252))
+    db.commit()
+    crud_mri.extend_portfolio_series(session=db, since=datetime.datetime(2002, 1, 3))
+    crud_mri.bump_dataset_version(session=db)
+    db.commit()
+    data = client.get(url, headers=superuser_token_headers).json()
+    assert [point["Value"] for point in data["time_series"]] == [1.0, 2.0]
+
+
 def test_create_portfolio(
         client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -215,3 +268,705 @@ def test_delete_portfolio(
         headers=superuser_token_headers
     )
     assert response.status_code == 404
+
+
+def test_get_portfolio_reads_materialized_series(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    date = datetime.datetime(2001, 1, 2)
+    db.add_all([
+        asset_output(db, date=date, domain="Series Domain", asset_class="Series Class", rpr=10.0, lookback=21),
+        asset_output(db, date=date, domain="Series Domain", asset_class="Series Class", rpr=20.0, lookback=63),
+    ])
+    db.commit()
+
+    portfolio_data = {
+        "name": "Series Portfolio",
+        "assets": [
+            {
+                "asset_name": "Series Asset",
+                "asset_domain": "Series Domain",
+                "asset_class": "Series Class",
+                "weight": 0.5
+            }
+        ]
+    }
+    response = client.post(f"{settings.API_V1_STR}/mri/", headers=superuser_token_headers, json=portfolio_data)
+    assert response.status_code == 200
+    portfolio_id = UUID(response.json()["id"])
+
+    series = db.exec(
+        select(MRIPortfolioSeries).where(MRIPortfolioSeries.portfolio_id == portfolio_id)
+    ).all()
+    assert {(row.lookback, row.value) for row in series} == {(21, 5.0), (63, 10.0)}
+
+    response = client.get(f"{settings.API_V1_STR}/mri/{portfolio_id}?lookback=63", headers=superuser_token_headers)
+    assert response.status_code == 200
+    assert response.json()["time_series"] == [{"Date": epoch_seconds(date), "Value": 10.0}]
+
+
+def test_extend_portfolio_series(db: Session) -> None:
+    portfolio = MRIPortfolio(name="Extended Portfolio", user_id=UUID("00000000-6666-0000-0000-000000000000"))
+    db.add(portfolio)
+    db.commit()
+    db.add(MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name="Extended Asset",
+                                   asset_domain="Extended Domain", asset_class="Extended Class", weight=1.0))
+    db.add(asset_output(db, date=datetime.datetime(2001, 1, 2), domain="Extended Domain",
+                            asset_class="Extended Class", rpr=1.0, lookback=21))
+    db.commit()
+    crud_mri.rebuild_portfolio_series(session=db, portfolio_ids=[portfolio.id])
+    db.commit()
+
+    db.add(asset_output(db, date=datetime.datetime(2001, 1, 3), domain="Extended Domain",
+                            asset_class="Extended Class", rpr=2.0, lookback=21))
+    db.commit()
+    crud_mri.extend_portfolio_series(session=db, since=datetime.datetime(2001, 1, 3))
+    db.commit()
+
+    series = crud_mri.get_portfolio_series(session=db, portfolio_id=portfolio.id, lookback=21)
+    assert [value for _, value in series] == [1.0, 2.0]
+
+
+def test_fill_portfolio_series_is_idempotent(db: Session) -> None:
+    portfolio = MRIPortfolio(name="Filled Portfolio", user_id=UUID("00000000-6666-0000-0000-000000000000"))
+    db.add(portfolio)
+    db.commit()
+    db.add(MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name="Filled Asset",
+                                   asset_domain="Filled Domain", asset_class="Filled Class", weight=1.0))
+    db.add(asset_output(db, date=datetime.datetime(2001, 1, 2), domain="Filled Domain",
+                        asset_class="Filled Class", rpr=1.0, lookback=21))
+    db.commit()
+
+    # Two first reads both find the series missing, the later fill leaves the earlier one's rows alone
+    with Session(engine) as first, Session(engine) as second:
+        assert crud_mri.ensure_portfolio_series(session=first, portfolio_id=portfolio.id, lookback=21)
+        first.commit()
+        crud_mri.fill_portfolio_series(session=second, portfolio_ids=[portfolio.id], lookback=21)
+        second.commit()
+        assert not crud_mri.ensure_portfolio_series(session=second, portfolio_id=portfolio.id, lookback=21)
+
+    series = crud_mri.get_portfolio_series(session=db, portfolio_id=portfolio.id, lookback=21)
+    assert [value for _, value in series] == [1.0]
+
+
+def test_get_user_portfolios_query_count_is_constant(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user_id = UUID("00000000-6666-0000-0000-000000000000")
+
+    def add_portfolios(count: int) -> None:
+        for i in range(count):
+            portfolio = MRIPortfolio(name=f"Counted Portfolio {i}", user_id=user_id)
+            db.add(portfolio)
+            db.flush()
+            db.add_all([
+                MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name=f"Asset {j}", asset_domain="Domain",
+                                        asset_class=f"Class {j}", weight=0.25)
+                for j in range(4)
+            ])
+        db.commit()
+
+    def get_portfolios() -> int:
+        with count_queries(engine) as queries:
+            response = client.get(f"{settings.API_V1_STR}/mri/", headers=superuser_token_headers)
+        assert response.status_code == 200
+        assert all(len(portfolio["assets"]) == 4 for portfolio in response.json())
+        return len(queries)
+
+    add_portfolios(2)
+    queries_for_two = get_portfolios()
+    add_portfolios(20)
+    queries_for_twenty_two = get_portfolios()
+
+    assert queries_for_twenty_two == queries_for_two
+
+
+def test_import_portfolios(
+        client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    content = (
+        "name,asset_name,asset_domain,asset_class,weight\n"
+        "Imported 1,Asset 1,Domain 1,Class 1,0.5\n"
+        "Imported 1,Asset 2,Domain 2,Class 2,0.5\n"
+        "Imported 2,Asset 3,Domain 3,Class 3,1.0\n"
+    )
+    response = client.post(
+        f"{settings.API_V1_STR}/mri/import",
+        headers=superuser_token_headers,
+        files={"file": ("portfolios.csv", content, "text/csv")},
+    )
+    assert response.status_code == 200, f"Unexpected response: {response.json()}"
+    data = response.json()
+    assert [portfolio["name"] for portfolio in data] == ["Imported 1", "Imported 2"]
+    assert [len(portfolio["assets"]) for portfolio in data] == [2, 1]
+    assert data[1]["assets"][0]["weight"] == 1.0
+
+    response = client.get(f"{settings.API_V1_STR}/mri/", headers=superuser_token_headers)
+    assert {portfolio["name"] for portfolio in response.json()} == {"Imported 1", "Imported 2"}
+
+
+def test_import_portfolios_invalid_csv(
+        client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/mri/import",
+        headers=superuser_token_headers,
+        files={"file": ("portfolios.csv", "name,asset_name\nBroken,Asset\n", "text/csv")},
+    )
+    assert response.status_code == 400
+
+
+def test_update_portfolio_applies_constituent_diff(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user_id = UUID("00000000-6666-0000-0000-000000000000")
+    portfolio = MRIPortfolio(name="Diff Portfolio", user_id=user_id)
+    db.add(portfolio)
+    db.commit()
+    kept = MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name="Kept", asset_domain="Domain 1",
+                                   asset_class="Class 1", weight=0.5)
+    changed = MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name="Changed", asset_domain="Domain 2",
+                                      asset_class="Class 2", weight=0.25)
+    removed = MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name="Removed", asset_domain="Domain 3",
+                                      asset_class="Class 3", weight=0.25)
+    db.add_all([kept, changed, removed])
+    db.commit()
+    kept_id, changed_id, removed_id = str(kept.id), str(changed.id), str(removed.id)
+
+    update_data = {
+        "assets": [
+            {"id": kept_id},
+            {"id": changed_id, "weight": 0.3},
+            {"asset_name": "Added", "asset_domain": "Domain 4", "asset_class": "Class 4", "weight": 0.2},
+        ]
+    }
+    response = client.put(
+        f"{settings.API_V1_STR}/mri/{portfolio.id}",
+        headers=superuser_token_headers,
+        json=update_data
+    )
+    assert response.status_code == 200, f"Unexpected response: {response.json()}"
+    data = response.json()
+    assert data["name"] == "Diff Portfolio"
+    assert [(asset["id"], asset["weight"]) for asset in data["assets"][:2]] == [(kept_id, 0.5), (changed_id, 0.3)]
+    assert data["assets"][2]["asset_name"] == "Added"
+
+    db.expire_all()
+    stored = db.exec(
+        select(MRIPortfolioConstituent).where(MRIPortfolioConstituent.portfolio_id == portfolio.id)
+    ).all()
+    assert {str(asset.id) for asset in stored} == {kept_id, changed_id, data["assets"][2]["id"]}
+    assert removed_id not in {str(asset.id) for asset in stored}
+
+
+def test_update_portfolio_unknown_constituent(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user_id = UUID("00000000-6666-0000-0000-000000000000")
+    portfolio = MRIPortfolio(name="Diff Portfolio", user_id=user_id)
+    db.add(portfolio)
+    db.commit()
+
+    response = client.put(
+        f"{settings.API_V1_STR}/mri/{portfolio.id}",
+        headers=superuser_token_headers,
+        json={"assets": [{"id": "00000000-0000-0000-0000-000000000001", "weight": 0.5}]}
+    )
+    assert response.status_code == 400
+
+
+def test_get_portfolio_time_series_is_cached(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user_id = UUID("00000000-6666-0000-0000-000000000000")
+    portfolio = MRIPortfolio(name="Cached Portfolio", user_id=user_id)
+    db.add(portfolio)
+    db.commit()
+    db.add(MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name="Cached Asset", asset_domain="Cached Domain",
+                                   asset_class="Cached Class", weight=1.0))
+    db.add(asset_output(db, date=datetime.datetime(2001, 1, 2), domain="Cached Domain", asset_class="Cached Class",
+                            rpr=1.0, lookback=21))
+    db.commit()
+    url = f"{settings.API_V1_STR}/mri/{portfolio.id}?lookback=21"
+
+    def stats() -> dict[str, int]:
+        return client.get(f"{settings.API_V1_STR}/mri/cache-stats", headers=superuser_token_headers).json()
+
+    before = stats()
+    first = client.get(url, headers=superuser_token_headers).json()
+    second = client.get(url, headers=superuser_token_headers).json()
+    assert first["time_series"] == second["time_series"] == [
+        {"Date": epoch_seconds(datetime.datetime(2001, 1, 2)), "Value": 1.0}
+    ]
+    after = stats()
+    assert after["misses"] == before["misses"] + 1
+    assert after["hits"] == before["hits"] + 1
+
+    # Ingesting new outputs bumps the dataset version and misses the cache
+    db.add(asset_output(db, date=datetime.datetime(2001, 1, 3), domain="Cached Domain", asset_class="Cached Class",
+                            rpr=2.0, lookback=21))
+    db.commit()
+    crud_mri.extend_portfolio_series(session=db, since=datetime.datetime(2001, 1, 3))
+    crud_mri.bump_dataset_version(session=db)
+    db.commit()
+    assert len(client.get(url, headers=superuser_token_headers).json()["time_series"]) == 2
+
+    # Editing the constituents bumps the portfolio version
+    asset_id = first["assets"][0]["id"]
+    response = client.put(url.split("?")[0], headers=superuser_token_headers,
+                          json={"assets": [{"id": asset_id, "weight": 0.5}]})
+    assert response.status_code == 200
+    data = client.get(url, headers=superuser_token_headers).json()
+    assert [point["Value"] for point in data["time_series"]] == [0.5, 1.0]
+
+
+def test_get_portfolio_conditional_get(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user_id = UUID("00000000-6666-0000-0000-000000000000")
+    portfolio = MRIPortfolio(name="Tagged Portfolio", user_id=user_id)
+    db.add(portfolio)
+    db.commit()
+    db.add(MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name="Tagged Asset", asset_domain="Tagged Domain",
+                                   asset_class="Tagged Class", weight=1.0))
+    db.add(asset_output(db, date=datetime.datetime(2003, 1, 2), domain="Tagged Domain", asset_class="Tagged Class",
+                        rpr=1.0, lookback=21))
+    db.commit()
+    url = f"{settings.API_V1_STR}/mri/{portfolio.id}?lookback=21"
+
+    response = client.get(url, headers=superuser_token_headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    # A revalidation is answered before the series is read
+    with count_queries(engine) as queries:
+        response = client.get(url, headers={**superuser_token_headers, "If-None-Match": f"W/{etag}, \"other\""})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert not any("mri_asset_outputs" in statement or "mri_portfolio_series" in statement
+                   for statement, _ in queries), queries
+
+    # Other query parameters are other representations
+    response = client.get(f"{url}&max_points=3", headers={**superuser_token_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+
+    # An ingest changes the tag
+    crud_mri.bump_dataset_version(session=db)
+    db.commit()
+    response = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_get_portfolio_range_and_downsampling(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user_id = UUID("00000000-6666-0000-0000-000000000000")
+    portfolio = MRIPortfolio(name="Long Portfolio", user_id=user_id)
+    db.add(portfolio)
+    db.commit()
+    db.add(MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name="Long Asset", asset_domain="Long Domain",
+                                   asset_class="Long Class", weight=1.0))
+    first_date = datetime.datetime(2000, 1, 1)
+    db.add_all([
+        asset_output(db, date=first_date + datetime.timedelta(days=i), domain="Long Domain", asset_class="Long Class",
+                         rpr=float(i % 7), lookback=21)
+        for i in range(500)
+    ])
+    db.commit()
+    url = f"{settings.API_V1_STR}/mri/{portfolio.id}"
+
+    response = client.get(url, headers=superuser_token_headers, params={"lookback": 21, "max_points": 50})
+    assert response.status_code == 200
+    time_series = response.json()["time_series"]
+    assert len(time_series) == 50
+    assert time_series[0]["Date"] == epoch_seconds(first_date)
+    assert time_series[-1]["Date"] == epoch_seconds(first_date + datetime.timedelta(days=499))
+
+    response = client.get(url, headers=superuser_token_headers, params={
+        "lookback": 21, "start": "2000-01-11T00:00:00", "end": "2000-01-20T00:00:00",
+    })
+    time_series = response.json()["time_series"]
+    assert len(time_series) == 10
+    assert time_series[0]["Date"] == epoch_seconds(datetime.datetime(2000, 1, 11))
+
+    response = client.get(url, headers=superuser_token_headers, params={"lookback": 21, "max_points": 2})
+    assert response.status_code == 422
+
+
+@pytest.mark.usefixtures("local_time_zone")
+def test_get_portfolio_binary_formats(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user_id = UUID("00000000-6666-0000-0000-000000000000")
+    portfolio = MRIPortfolio(name="Binary Portfolio", user_id=user_id)
+    db.add(portfolio)
+    db.commit()
+    db.add(MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name="Binary Asset", asset_domain="Binary Domain",
+                                   asset_class="Binary Class", weight=0.5))
+    dates = [datetime.datetime(2001, 1, 2), datetime.datetime(2001, 1, 3)]
+    db.add_all([
+        asset_output(db, date=date, domain="Binary Domain", asset_class="Binary Class", rpr=rpr, lookback=21)
+        for date, rpr in zip(dates, [2.0, 4.0], strict=True)
+    ])
+    db.commit()
+    url = f"{settings.API_V1_STR}/mri/{portfolio.id}?lookback=21"
+
+    response = client.get(url, headers={**superuser_token_headers, "Accept": ARROW_STREAM})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == ARROW_STREAM
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column("Date").to_pylist() == [epoch_seconds(date) for date in dates]
+    assert table.column("Value").to_pylist() == [1.0, 2.0]
+    assert json.loads(table.schema.metadata[b"name"]) == "Binary Portfolio"
+
+    response = client.get(url, headers={**superuser_token_headers, "Accept": MSGPACK})
+    assert response.headers["content-type"] == MSGPACK
+    payload = msgpack.unpackb(response.content)
+    assert payload["Value"] == [1.0, 2.0]
+    assert payload["metadata"]["assets"][0]["asset_name"] == "Binary Asset"
+
+    response = client.get(url, headers={**superuser_token_headers, "Accept": f"{MSGPACK};q=0.5, application/json"})
+    assert response.json()["time_series"] == [
+        {"Date": epoch_seconds(date), "Value": value} for date, value in zip(dates, [1.0, 2.0], strict=True)
+    ]
+
+
+@pytest.mark.usefixtures("local_time_zone")
+def test_get_portfolio_ndjson_stream(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    user_id = UUID("00000000-6666-0000-0000-000000000000")
+    portfolio = MRIPortfolio(name="Streamed Portfolio", user_id=user_id)
+    db.add(portfolio)
+    db.commit()
+    db.add(MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name="Streamed Asset",
+                                   asset_domain="Streamed Domain", asset_class="Streamed Class", weight=0.5))
+    dates = [datetime.datetime(2001, 1, 1) + datetime.timedelta(days=day) for day in range(7)]
+    db.add_all([
+        asset_output(db, date=date, domain="Streamed Domain", asset_class="Streamed Class", rpr=float(i), lookback=21)
+        for i, date in enumerate(dates)
+    ])
+    db.commit()
+    # Several cursor batches and response chunks
+    monkeypatch.setattr(crud_mri, "SERIES_STREAM_BATCH_SIZE", 2)
+    monkeypatch.setattr(responses, "NDJSON_CHUNK_LINES", 3)
+    url = f"{settings.API_V1_STR}/mri/{portfolio.id}?lookback=21"
+
+    response = client.get(url, headers={**superuser_token_headers, "Accept": NDJSON})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == NDJSON
+    assert "etag" in response.headers
+    header, *points = [json.loads(line) for line in response.text.splitlines()]
+    assert header["name"] == "Streamed Portfolio"
+    assert header["assets"][0]["asset_name"] == "Streamed Asset"
+    assert "time_series" not in header
+    assert points == [{"Date": epoch_seconds(date), "Value": i * 0.5} for i, date in enumerate(dates)]
+
+    response = client.get(f"{url}&start=2001-01-03T00:00:00&end=2001-01-04T00:00:00",
+                          headers={**superuser_token_headers, "Accept": NDJSON})
+    assert [json.loads(line)["Value"] for line in response.text.splitlines()[1:]] == [1.0, 1.5]
+
+    # Downsampled series are small, they are streamed from memory
+    response = client.get(f"{url}&max_points=3", headers={**superuser_token_headers, "Accept": NDJSON})
+    points = [json.loads(line) for line in response.text.splitlines()[1:]]
+    assert [point["Date"] for point in points] == [epoch_seconds(date) for date in (dates[0], dates[1], dates[-1])]
+
+
+def test_get_portfolio_analytics(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    user_id = UUID("00000000-6666-0000-0000-000000000000")
+    portfolio = MRIPortfolio(name="Analytics Portfolio", user_id=user_id)
+    db.add(portfolio)
+    db.commit()
+    db.add(MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name="Analytics Asset",
+                                   asset_domain="Analytics Domain", asset_class="Analytics Class", weight=1.0))
+    dates = [datetime.datetime(2004, 1, 1) + datetime.timedelta(days=day) for day in range(4)]
+    db.add_all([
+        asset_output(db, date=date, domain="Analytics Domain", asset_class="Analytics Class", rpr=rpr, lookback=21)
+        for date, rpr in zip(dates, [1.0, 3.0, 2.0, 4.0], strict=True)
+    ])
+    db.commit()
+    url = f"{settings.API_V1_STR}/mri/{portfolio.id}/analytics?lookback=21&windows=2&windows=3&percentiles=50"
+
+    def stats() -> dict[str, int]:
+        return client.get(f"{settings.API_V1_STR}/mri/cache-stats", headers=superuser_token_headers).json()
+
+    response = client.get(url, headers=superuser_token_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["lookback"] == 21
+    assert data["max_drawdown"] == -1.0
+    series = data["series"]
+    assert series["Date"] == [epoch_seconds(date) for date in dates]
+    assert series["Value"] == [1.0, 3.0, 2.0, 4.0]
+    assert series["drawdown"] == [0.0, 0.0, -1.0, 0.0]
+    assert series["mean_2"] == [None, 2.0, 2.5, 3.0]
+    assert series["mean_3"] == [None, None, 2.0, 3.0]
+    assert series["p50_3"] == [None, None, 2.0, 3.0]
+    assert series["volatility_2"][:2] == [None, None]
+    assert series["volatility_2"][2] == pytest.approx(3 / 2 ** 0.5)
+
+    # Served from the series cache
+    before = stats()
+    assert client.get(url, headers=superuser_token_headers).json() == data
+    after = stats()
+    assert after["misses"] == before["misses"]
+    assert after["hits"] > before["hits"]
+
+    response = client.get(url, headers={**superuser_token_headers, "Accept": MSGPACK})
+    assert msgpack.unpackb(response.content)["mean_3"] == [None, None, 2.0, 3.0]
+
+    # Percentiles default to the 5th and 95th
+    series = client.get(f"{settings.API_V1_STR}/mri/{portfolio.id}/analytics?lookback=21&windows=2",
+                        headers=superuser_token_headers).json()["series"]
+    assert series["p5_2"] == [None, 1.1, 2.05, 2.1]
+    assert series["p95_2"] == [None, 2.9, 2.95, 3.9]
+
+    response = client.get(f"{url}&windows=1", headers=superuser_token_headers)
+    assert response.status_code == 422
+    # A window longer than the series, like the default 21 points, is rejected without computing anything
+    def rolling_analytics(*args: object) -> None:
+        raise AssertionError("rolling_analytics called")
+
+    monkeypatch.setattr(crud_mri, "rolling_analytics", rolling_analytics)
+    for windows in ("windows=5", ""):
+        response = client.get(f"{settings.API_V1_STR}/mri/{portfolio.id}/analytics?lookback=21&{windows}",
+                              headers=superuser_token_headers)
+        assert response.status_code == 422
+    response = client.get(f"{url}&percentiles=101", headers=superuser_token_headers)
+    assert response.status_code == 422
+
+
+def test_get_portfolios_batch(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user_id = UUID("00000000-6666-0000-0000-000000000000")
+    portfolios = [MRIPortfolio(name=f"Batch Portfolio {i}", user_id=user_id) for i in range(2)]
+    db.add_all(portfolios)
+    db.commit()
+    db.add_all([
+        MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name="Batch Asset", asset_domain="Batch Domain",
+                                asset_class="Batch Class", weight=weight)
+        for portfolio, weight in zip(portfolios, [1.0, 0.5], strict=True)
+    ])
+    date = datetime.datetime(2001, 1, 2)
+    db.add_all([
+        asset_output(db, date=date, domain="Batch Domain", asset_class="Batch Class", rpr=rpr, lookback=lookback)
+        for lookback, rpr in [(21, 2.0), (63, 4.0), (126, 8.0)]
+    ])
+    db.commit()
+
+    response = client.post(
+        f"{settings.API_V1_STR}/mri/batch",
+        headers=superuser_token_headers,
+        json={"portfolio_ids": [str(portfolio.id) for portfolio in portfolios], "lookbacks": [21, 63]},
+    )
+    assert response.status_code == 200, f"Unexpected response: {response.json()}"
+    series = response.json()["series"]
+    assert series[str(portfolios[0].id)]["21"] == [{"Date": epoch_seconds(date), "Value": 2.0}]
+    assert series[str(portfolios[0].id)]["63"] == [{"Date": epoch_seconds(date), "Value": 4.0}]
+    assert series[str(portfolios[1].id)]["63"] == [{"Date": epoch_seconds(date), "Value": 2.0}]
+    # Only the requested lookbacks were materialized
+    materialized = db.exec(
+        select(MRIPortfolioSeries.lookback).where(MRIPortfolioSeries.portfolio_id.in_([p.id for p in portfolios]))
+    ).all()
+    assert sorted(materialized) == [21, 21, 63, 63]
+
+
+def test_get_portfolios_batch_permissions(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    other_portfolio = MRIPortfolio(name="Other Portfolio", user_id=UUID("00000000-7777-0000-0000-000000000000"))
+    db.add(other_portfolio)
+    db.commit()
+
+    response = client.post(
+        f"{settings.API_V1_STR}/mri/batch",
+        headers=superuser_token_headers,
+        json={"portfolio_ids": [str(other_portfolio.id)], "lookbacks": [21]},
+    )
+    assert response.status_code == 403
+
+    response = client.post(
+        f"{settings.API_V1_STR}/mri/batch",
+        headers=superuser_token_headers,
+        json={"portfolio_ids": ["00000000-0000-0000-0000-000000000009"], "lookbacks": [21]},
+    )
+    assert response.status_code == 404
+
+
+def test_what_if_series(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    dates = [datetime.datetime(2001, 1, 2), datetime.datetime(2001, 1, 3)]
+    db.add_all([
+        asset_output(db, date=date, domain="What-If Domain", asset_class=asset_class, rpr=rpr, lookback=21)
+        for asset_class, date, rpr in [
+            ("What-If Class 1", dates[0], 2.0),
+            ("What-If Class 1", dates[1], 4.0),
+            ("What-If Class 2", dates[1], 10.0),
+        ]
+    ])
+    db.commit()
+    what_if_in = {
+        "lookback": 21,
+        "assets": [
+            {"asset_name": "A", "asset_domain": "What-If Domain", "asset_class": "What-If Class 1", "weight": 0.5},
+            {"asset_name": "B", "asset_domain": "What-If Domain", "asset_class": "What-If Class 2", "weight": 0.1},
+        ],
+    }
+
+    response = client.post(f"{settings.API_V1_STR}/mri/what-if", headers=superuser_token_headers, json=what_if_in)
+    assert response.status_code == 200, f"Unexpected response: {response.json()}"
+    assert response.json()["time_series"] == [
+        {"Date": epoch_seconds(dates[0]), "Value": 1.0},
+        {"Date": epoch_seconds(dates[1]), "Value": 3.0},
+    ]
+    assert db.exec(select(MRIPortfolio).where(MRIPortfolio.name == "What-If")).first() is None
+
+    response = client.post(f"{settings.API_V1_STR}/mri/what-if", headers=superuser_token_headers,
+                           json={"lookback": 21, "assets": []})
+    assert response.status_code == 422
+
+
+def test_what_if_and_portfolio_series_from_matrix(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session, tmp_path, monkeypatch
+) -> None:
+    user_id = UUID("00000000-6666-0000-0000-000000000000")
+    portfolio = MRIPortfolio(name="Matrix Portfolio", user_id=user_id)
+    db.add(portfolio)
+    db.commit()
+    db.add_all([
+        MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name=f"Matrix Asset {i}", asset_domain="Matrix Domain",
+                                asset_class=f"Matrix Class {i}", weight=weight)
+        for i, weight in enumerate([0.25, 0.75])
+    ])
+    first_date = datetime.datetime(2002, 1, 1)
+    db.add_all([
+        asset_output(db, date=first_date + datetime.timedelta(days=day), domain="Matrix Domain",
+                         asset_class=f"Matrix Class {i}", rpr=float(day + i), lookback=21)
+        for i in range(2)
+        for day in range(10)
+        if not (i == 1 and day % 3 == 0)
+    ])
+    db.commit()
+    crud_mri.bump_dataset_version(session=db)
+    db.commit()
+    url = f"{settings.API_V1_STR}/mri/{portfolio.id}?lookback=21"
+    what_if_in = {
+        "lookback": 21,
+        "assets": [
+            {"asset_name": asset.asset_name, "asset_domain": asset.asset_domain, "asset_class": asset.asset_class,
+             "weight": asset.weight}
+            for asset in portfolio.assets
+        ],
+    }
+    from_database = client.post(f"{settings.API_V1_STR}/mri/what-if", headers=superuser_token_headers,
+                                json=what_if_in).json()["time_series"]
+
+    monkeypatch.setattr(settings, "MRI_SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(mri_matrix, "_matrix", None)
+    monkeypatch.setattr(mri_matrix, "_miss", None)
+    dataset_version = crud_mri.get_dataset_version(session=db)
+    mri_matrix.write_snapshot(session=db, directory=tmp_path, dataset_version=dataset_version)
+    assert mri_matrix.get_matrix(dataset_version=dataset_version) is not None
+
+    with count_queries(engine) as queries:
+        from_matrix = client.post(f"{settings.API_V1_STR}/mri/what-if", headers=superuser_token_headers,
+                                  json=what_if_in).json()["time_series"]
+    assert not any("mri_asset_outputs" in statement for statement, _ in queries)
+    assert len(from_matrix) == len(from_database) == 10
+    for point, expected in zip(from_matrix, from_database, strict=True):
+        assert point["Date"] == expected["Date"]
+        assert point["Value"] == pytest.approx(expected["Value"])
+
+    portfolio_series = client.get(url, headers=superuser_token_headers).json()["time_series"]
+    assert portfolio_series == from_matrix
+
+    # A snapshot of an older dataset is ignored
+    assert mri_matrix.get_matrix(dataset_version=dataset_version + 1) is None
+
+
+def test_get_matrix_caches_missing_snapshot(db: Session, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "MRI_SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(mri_matrix, "_matrix", None)
+    monkeypatch.setattr(mri_matrix, "_miss", None)
+    loads: list[Path] = []
+    load = mri_matrix.AssetOutputMatrix.load
+
+    def counting_load(directory: Path) -> mri_matrix.AssetOutputMatrix | None:
+        loads.append(directory)
+        return load(directory)
+
+    monkeypatch.setattr(mri_matrix.AssetOutputMatrix, "load", staticmethod(counting_load))
+    dataset_version = crud_mri.get_dataset_version(session=db)
+    for _ in range(3):
+        assert mri_matrix.get_matrix(dataset_version=dataset_version) is None
+    assert loads == [tmp_path]
+
+    # A snapshot written after the miss is still picked up
+    mri_matrix.write_snapshot(session=db, directory=tmp_path, dataset_version=dataset_version)
+    assert mri_matrix.get_matrix(dataset_version=dataset_version) is not None
+    assert mri_matrix.get_matrix(dataset_version=dataset_version) is not None
+    assert len(loads) == 2
+
+
+def test_get_portfolio_contributions(
+        client: TestClient, superuser_token_headers: dict[str, str], db: Session, tmp_path, monkeypatch
+) -> None:
+    user_id = UUID("00000000-6666-0000-0000-000000000000")
+    portfolio = MRIPortfolio(name="Breakdown Portfolio", user_id=user_id)
+    db.add(portfolio)
+    db.commit()
+    # The last constituent has no outputs at all
+    db.add_all([
+        MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name=f"Breakdown Asset {i}",
+                                asset_domain="Breakdown Domain", asset_class=f"Breakdown Class {i}", weight=weight)
+        for i, weight in enumerate([0.25, 0.75, 0.5])
+    ])
+    dates = [datetime.datetime(2005, 1, 1) + datetime.timedelta(days=day) for day in range(3)]
+    db.add_all([
+        asset_output(db, date=date, domain="Breakdown Domain", asset_class=f"Breakdown Class {i}",
+                     rpr=float(day + 1), lookback=21)
+        for i in range(2)
+        for day, date in enumerate(dates)
+        if not (i == 1 and day == 0)
+    ])
+    db.commit()
+    constituent_ids = [str(asset.id) for asset in portfolio.assets]
+    url = f"{settings.API_V1_STR}/mri/{portfolio.id}/contributions?lookback=21"
+
+    with count_queries(engine) as queries:
+        response = client.get(url, headers=superuser_token_headers)
+    assert response.status_code == 200
+    assert len([statement for statement, _ in queries if "mri_asset_outputs" in statement]) == 1
+    data = response.json()
+    assert [asset["id"] for asset in data["assets"]] == constituent_ids
+    from_database = data["contributions"]
+    assert from_database == {
+        "Date": [epoch_seconds(date) for date in dates],
+        constituent_ids[0]: [0.25, 0.5, 0.75],
+        constituent_ids[1]: [None, 1.5, 2.25],
+        constituent_ids[2]: [None, None, None],
+    }
+
+    # The columns add up to the portfolio series
+    series = client.get(f"{settings.API_V1_STR}/mri/{portfolio.id}?lookback=21",
+                        headers=superuser_token_headers).json()["time_series"]
+    assert [point["Value"] for point in series] == [0.25, 2.0, 3.0]
+
+    crud_mri.bump_dataset_version(session=db)
+    db.commit()
+    monkeypatch.setattr(settings, "MRI_SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(mri_matrix, "_matrix", None)
+    monkeypatch.setattr(mri_matrix, "_miss", None)
+    mri_matrix.write_snapshot(session=db, directory=tmp_path, dataset_version=crud_mri.get_dataset_version(session=db))
+    assert client.get(url, headers=superuser_token_headers).json()["contributions"] == from_database
+
+    response = client.get(url, headers={**superuser_token_headers, "Accept": ARROW_STREAM})
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column_names == ["Date", *constituent_ids]
+    assert table.column(constituent_ids[1]).to_pylist() == [None, 1.5, 2.25]
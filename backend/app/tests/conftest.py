@@ -1,3 +1,4 @@
+import time
 from collections.abc import Generator
 from datetime import datetime, timedelta
 from uuid import UUID
@@ -30,6 +31,18 @@ def db() -> Generator[Session, None, None]:
     SQLModel.metadata.drop_all(engine)
 
 
+@pytest.fixture
+def local_time_zone(monkeypatch: pytest.MonkeyPatch) -> Generator[None, None, None]:
+    """
+    Run the test with a server local time zone away from UTC.
+    """
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
 @pytest.fixture
 def current_user():
     return CurrentUser(id=1, is_superuser=True)  # Mock a user with id=1
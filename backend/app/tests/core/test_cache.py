@@ -0,0 +1,52 @@
+from unittest.mock import patch
+
+from app.core.cache import LRUCache
+
+
+def test_cache_hit_and_miss() -> None:
+    cache = LRUCache(max_bytes=100, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", [1, 2], size=10)
+    assert cache.get("a") == [1, 2]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["bytes"] == 10
+
+
+def test_cache_evicts_least_recently_used_by_size() -> None:
+    cache = LRUCache(max_bytes=100, ttl=60)
+    cache.set("a", "a", size=40)
+    cache.set("b", "b", size=40)
+    cache.get("a")
+    cache.set("c", "c", size=40)
+    assert cache.get("b") is None
+    assert cache.get("a") == "a"
+    assert cache.get("c") == "c"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 80
+
+
+def test_cache_skips_values_larger_than_capacity() -> None:
+    cache = LRUCache(max_bytes=100, ttl=60)
+    cache.set("a", "a", size=101)
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_cache_entries_expire() -> None:
+    cache = LRUCache(max_bytes=100, ttl=60)
+    with patch("app.core.cache.time.monotonic", return_value=1000.0):
+        cache.set("a", "a", size=10)
+    with patch("app.core.cache.time.monotonic", return_value=1061.0):
+        assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_cache_invalidate() -> None:
+    cache = LRUCache(max_bytes=100, ttl=60)
+    cache.set(("p1", 21), 1, size=10)
+    cache.set(("p1", 63), 2, size=10)
+    cache.set(("p2", 21), 3, size=10)
+    cache.invalidate(lambda key: key[0] == "p1")
+    assert cache.stats()["entries"] == 1
+    assert cache.get(("p2", 21)) == 3
@@ -0,0 +1,22 @@
+from pathlib import Path
+
+import pytest
+
+from app.core.config import BACKEND_DIR, Settings
+
+
+def load_settings() -> Settings:
+    # The .env file is found from the working directory
+    return Settings(_env_file=BACKEND_DIR.parent / ".env")  # type: ignore[call-arg]
+
+
+def test_data_paths_are_anchored_to_backend_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    settings = load_settings()
+    assert settings.MRI_SNAPSHOT_DIR == str(BACKEND_DIR / "data" / "mri_snapshot")
+    assert settings.MRI_DATA_DIRS == [str(BACKEND_DIR / "data")]
+
+    monkeypatch.setenv("MRI_DATA_DIRS", f"data, {tmp_path}")
+    assert load_settings().MRI_DATA_DIRS == [str(BACKEND_DIR / "data"), str(tmp_path)]
+    monkeypatch.setenv("MRI_DATA_DIRS", '["data"]')
+    assert load_settings().MRI_DATA_DIRS == [str(BACKEND_DIR / "data")]
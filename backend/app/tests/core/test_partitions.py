@@ -0,0 +1,48 @@
+from datetime import date, datetime
+
+from sqlmodel import Session, text
+
+from app.core.partitions import ensure_partitions, is_partition
+from app.models_crr import CDSPrice, CRRSecurity
+
+
+def test_ensure_partitions_moves_rows_out_of_default_partition(db: Session) -> None:
+    security = CRRSecurity(ticker_bbg="PARTITION TEST")
+    db.add(security)
+    db.commit()
+    db.add_all([
+        CDSPrice(security_id=security.id, entry_date=datetime(1990, 3, 1), price=1.0),
+        CDSPrice(security_id=security.id, entry_date=datetime(1991, 3, 1), price=2.0),
+    ])
+    db.commit()
+    assert db.execute(text("SELECT count(*) FROM cds_prices_default")).scalar() >= 2
+
+    created = ensure_partitions(db, years=[1989])
+    db.commit()
+
+    assert {"cds_prices_y1989", "cds_prices_y1990", "cds_prices_y1991"} <= set(created)
+    # Created by this call or an earlier one
+    this_year = date.today().year
+    for name in (f"crr_prices_y{this_year + 1}", f"mri_asset_outputs_y{this_year}"):
+        assert db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None
+    assert ensure_partitions(db) == []
+    assert db.execute(text("SELECT count(*) FROM cds_prices_default")).scalar() == 0
+    assert db.execute(text("SELECT price FROM cds_prices_y1990")).scalars().all() == [1.0]
+
+    plan = "\n".join(row[0] for row in db.execute(text("""
+        EXPLAIN SELECT price FROM cds_prices
+        WHERE entry_date >= '1991-01-01' AND entry_date < '1991-06-01'
+    """)))
+    assert "cds_prices_y1991" in plan, plan
+    assert "cds_prices_y1990" not in plan and "cds_prices_default" not in plan, plan
+
+    db.execute(text("DELETE FROM cds_prices WHERE security_id = :id"), {"id": security.id})
+    db.delete(security)
+    db.commit()
+
+
+def test_is_partition() -> None:
+    assert is_partition("mri_asset_outputs_default")
+    assert is_partition("crr_prices_y2024")
+    assert not is_partition("crr_prices")
+    assert not is_partition("crr_securities_y2024")
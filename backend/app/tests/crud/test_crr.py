@@ -0,0 +1,54 @@
+import uuid
+from datetime import datetime
+from typing import Any
+
+from sqlmodel import Session, select
+
+from app.models_crr import CDSPrice, CRRLatestPrice, CRRPrice, CRRSecurity
+
+
+def test_latest_prices_follow_price_tables(db: Session) -> None:
+    security = CRRSecurity(ticker_bbg=f"LATEST {uuid.uuid4()}")
+    db.add(security)
+    db.commit()
+
+    def latest() -> tuple[Any, ...]:
+        db.expire_all()
+        row = db.get(CRRLatestPrice, security.id)
+        return row.cds_price, row.cds_date, row.crr_price, row.crr_date, row.spread
+
+    try:
+        # Out of order inserts keep the latest entry
+        db.add_all([
+            CDSPrice(security_id=security.id, entry_date=datetime(2020, 1, 2), price=102.0),
+            CDSPrice(security_id=security.id, entry_date=datetime(2020, 1, 1), price=101.0),
+            CRRPrice(security_id=security.id, entry_date=datetime(2020, 1, 1), price=90.5),
+        ])
+        db.commit()
+        assert latest() == (102.0, datetime(2020, 1, 2), 90.5, datetime(2020, 1, 1), 11.5)
+
+        # Deleting the latest entry falls back to the one before
+        latest_cds = db.exec(
+            select(CDSPrice).where(CDSPrice.security_id == security.id, CDSPrice.entry_date == datetime(2020, 1, 2))
+        ).one()
+        db.delete(latest_cds)
+        db.commit()
+        assert latest() == (101.0, datetime(2020, 1, 1), 90.5, datetime(2020, 1, 1), 10.5)
+
+        # Corrections of the latest entry are picked up
+        crr = db.exec(select(CRRPrice).where(CRRPrice.security_id == security.id)).one()
+        crr.price = 0.0
+        db.add(crr)
+        db.commit()
+        assert latest() == (101.0, datetime(2020, 1, 1), 0.0, datetime(2020, 1, 1), None)
+
+        db.delete(crr)
+        db.commit()
+        assert latest() == (101.0, datetime(2020, 1, 1), None, None, None)
+    finally:
+        db.query(CDSPrice).filter(CDSPrice.security_id == security.id).delete()
+        db.query(CRRPrice).filter(CRRPrice.security_id == security.id).delete()
+        db.delete(security)
+        db.commit()
+    # Removed with its security
+    assert db.get(CRRLatestPrice, security.id) is None
@@ -0,0 +1,55 @@
+import uuid
+
+from sqlalchemy.dialects import postgresql
+from sqlmodel import Session, select, text
+
+from app import crud_mri
+from app.core.db import engine
+from app.core.partitions import ensure_partitions
+from app.models_mri import (
+    MRIAsset,
+    MRIAssetOutput,
+    MRIPortfolio,
+    MRIPortfolioConstituent,
+)
+
+
+def test_portfolio_series_uses_index_only_scan(db: Session) -> None:
+    portfolio = MRIPortfolio(name="Plan Portfolio", user_id=uuid.uuid4())
+    db.add(portfolio)
+    db.commit()
+    db.add_all([
+        MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name=f"plan_{i}", asset_domain="plan",
+                                asset_class=f"plan_{i}", weight=0.5)
+        for i in range(2)
+    ])
+    # 40 assets x 2 lookbacks x 2500 days, in the 2000 - 2006 partitions
+    ensure_partitions(db, years=range(2000, 2007))
+    db.execute(text("""
+        INSERT INTO mri_assets (asset_class, domain) SELECT 'plan_' || a, 'plan' FROM generate_series(0, 39) a
+    """))
+    db.execute(text("""
+        INSERT INTO mri_asset_outputs (asset_id, lookback, date, rpr)
+        SELECT assets.id, l, DATE '2000-01-01' + d, random()
+        FROM mri_assets assets, generate_series(0, 2499) d, unnest(ARRAY[21, 252]) l
+        WHERE assets.domain = 'plan'
+    """))
+    db.commit()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("VACUUM ANALYZE mri_asset_outputs"))
+
+    try:
+        statement = crud_mri.portfolio_series_statement(portfolio_ids=[portfolio.id], lookback=252)
+        sql = str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+        plan = "\n".join(row[0] for row in db.execute(text(f"EXPLAIN {sql}")))
+
+        for year in range(2000, 2007):
+            assert f"Index Only Scan using mri_asset_outputs_y{year}_pkey" in plan, plan
+            assert f"Seq Scan on mri_asset_outputs_y{year}" not in plan, plan
+    finally:
+        plan_assets = select(MRIAsset.id).where(MRIAsset.domain == "plan")
+        db.query(MRIAssetOutput).filter(MRIAssetOutput.asset_id.in_(plan_assets)).delete()
+        db.query(MRIAsset).filter(MRIAsset.domain == "plan").delete()
+        db.query(MRIPortfolioConstituent).filter(MRIPortfolioConstituent.portfolio_id == portfolio.id).delete()
+        db.delete(portfolio)
+        db.commit()
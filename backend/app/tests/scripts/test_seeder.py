@@ -0,0 +1,183 @@
+import datetime
+import importlib.util
+import sys
+from itertools import pairwise
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session, select, text
+
+from app.core import partitions
+from app.core.config import BACKEND_DIR
+from app.models_mri import MRIAsset, MRIAssetOutput, MRIIngestManifest
+
+spec = importlib.util.spec_from_file_location(
+    "seeder", Path(__file__).parents[3] / "scripts" / "seeder.py"
+)
+seeder = importlib.util.module_from_spec(spec)
+# Registered so worker processes can unpickle its functions
+sys.modules["seeder"] = seeder
+spec.loader.exec_module(seeder)
+
+
+def test_load_file_upserts_through_staging_table(db: Session, tmp_path: Path) -> None:
+    file_path = tmp_path / "seedclass_seed_domain_long.csv"
+    file_path.write_text(
+        "Date,seedclass,lookback\n"
+        "2001-01-03,2.0,21\n"
+        "2001-01-02,1.0,21\n"
+        "2001-01-02,1.5,63\n"
+    )
+    asset_class, domain = seeder.parse_filename(file_path.name)
+    assert (asset_class, domain) == ("seedclass", "seed_domain")
+
+    def load() -> tuple[int, datetime.datetime, datetime.datetime]:
+        seeder.create_staging_table(db)
+        result = seeder.load_file(db, file_path, asset_class, domain, chunk_size=2)
+        db.commit()
+        return result
+
+    def stored() -> list[tuple[datetime.date, int, float]]:
+        return db.exec(
+            select(MRIAssetOutput.date, MRIAssetOutput.lookback, MRIAssetOutput.rpr)
+            .join(MRIAsset)
+            .where(MRIAsset.asset_class == asset_class, MRIAsset.domain == domain)
+            .order_by(MRIAssetOutput.lookback, MRIAssetOutput.date)
+        ).all()
+
+    def asset_ids_used() -> int:
+        return db.execute(text("SELECT last_value FROM mri_assets_id_seq")).scalar_one()
+
+    assert load() == (3, datetime.datetime(2001, 1, 2), datetime.datetime(2001, 1, 3))
+    ids_used = asset_ids_used()
+    assert stored() == [
+        (datetime.date(2001, 1, 2), 21, 1.0),
+        (datetime.date(2001, 1, 3), 21, 2.0),
+        (datetime.date(2001, 1, 2), 63, 1.5),
+    ]
+
+    # Reloading a corrected file updates rows in place instead of duplicating them
+    file_path.write_text(
+        "Date,seedclass,lookback\n"
+        "2001-01-03,3.0,21\n"
+        "2001-01-04,4.0,21\n"
+    )
+    assert load() == (2, datetime.datetime(2001, 1, 3), datetime.datetime(2001, 1, 4))
+    assert [row[2] for row in stored()] == [1.0, 3.0, 4.0, 1.5]
+    # Known assets don't use up values of the catalog's id sequence
+    assert asset_ids_used() == ids_used
+
+
+def test_load_files_with_workers(db: Session, tmp_path: Path) -> None:
+    files = []
+    for i in range(3):
+        file_path = tmp_path / f"poolclass{i}_pool_long.csv"
+        file_path.write_text("Date,rpr,lookback\n" + "".join(
+            f"2001-01-{day:02d},{i + day},21\n" for day in range(1, 6)
+        ))
+        files.append((file_path, *seeder.parse_filename(file_path.name), None))
+
+    seeder.create_staging_table(db)
+    loaded = list(seeder.load_files(db, files, workers=2, chunk_size=2))
+    db.commit()
+
+    assert loaded == [
+        (file_path, 5, datetime.datetime(2001, 1, 1), datetime.datetime(2001, 1, 5)) for file_path, *_ in files
+    ]
+    rows = db.exec(
+        select(MRIAsset.asset_class, MRIAssetOutput.rpr)
+        .join(MRIAsset)
+        .where(MRIAsset.domain == "pool")
+        .order_by(MRIAsset.asset_class, MRIAssetOutput.date)
+    ).all()
+    assert rows == [(f"poolclass{i}", float(i + day)) for i in range(3) for day in range(1, 6)]
+
+
+def test_chunk_offsets_split_lines_across_blocks(tmp_path: Path) -> None:
+    file_path = tmp_path / "offsets.csv"
+    lines = [f"2001-01-{day:02d},{day * 1.5},21\n" for day in range(1, 12)]
+    for body in ("".join(lines), "".join(lines).rstrip("\n")):
+        file_path.write_text("Date,rpr,lookback\n" + body)
+        data = file_path.read_bytes()
+        for chunk_size in (1, 3, 11, 20):
+            for block_size in (1, 7, 1024):
+                offsets = seeder.chunk_offsets(file_path, chunk_size, block_size)
+                assert offsets[0] == len("Date,rpr,lookback\n") and offsets[-1] == len(data)
+                runs = [data[start:end].splitlines() for start, end in pairwise(offsets)]
+                assert [len(run) for run in runs[:-1]] == [chunk_size] * (len(runs) - 1)
+                assert b"".join(line + b"\n" for run in runs for line in run).decode() == "".join(lines)
+
+
+def test_manifest_skips_unchanged_files_and_loads_new_dates(db: Session, tmp_path: Path) -> None:
+    unchanged = tmp_path / "manifestclass_a_long.csv"
+    appended = tmp_path / "manifestclass_b_long.csv"
+    unchanged.write_text("Date,rpr,lookback\n2001-01-01,1.0,21\n")
+    appended.write_text("Date,rpr,lookback\n2001-01-01,1.0,21\n2001-01-02,2.0,21\n")
+
+    def ingest() -> list[tuple[str, int, datetime.datetime, datetime.datetime]]:
+        files, checksums = seeder.plan_files(db, [str(tmp_path)])
+        seeder.create_staging_table(db)
+        loaded = list(seeder.load_files(db, files))
+        for (file_path, rows, _, latest_date), job in zip(loaded, files, strict=True):
+            seeder.record_file(db, file_path, checksums[file_path], rows, latest_date, incremental=job[3] is not None)
+        db.commit()
+        return loaded
+
+    assert [rows for _, rows, _, _ in ingest()] == [1, 2]
+    assert ingest() == []
+
+    appended.write_text(appended.read_text() + "2001-01-03,3.0,21\n")
+    assert ingest() == [
+        (str(appended), 1, datetime.datetime(2001, 1, 3), datetime.datetime(2001, 1, 3))
+    ]
+    entry = db.get(MRIIngestManifest, seeder.manifest_key(appended))
+    db.refresh(entry)
+    assert (entry.rows, entry.max_date) == (3, datetime.datetime(2001, 1, 3))
+    assert db.exec(
+        select(MRIAssetOutput.rpr)
+        .join(MRIAsset)
+        .where(MRIAsset.asset_class == "manifestclass", MRIAsset.domain == "b")
+        .order_by(MRIAssetOutput.date)
+    ).all() == [1.0, 2.0, 3.0]
+
+
+def test_manifest_key_does_not_depend_on_working_directory(
+        tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    file_path = BACKEND_DIR / "data" / "keyclass_key_long.csv"
+    # Keys of the default data directory stay those of earlier relative runs
+    assert seeder.manifest_key(file_path) == "data/keyclass_key_long.csv"
+    monkeypatch.chdir(tmp_path)
+    assert seeder.manifest_key(file_path) == "data/keyclass_key_long.csv"
+
+
+def test_create_partitions_before_loading(db: Session, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    file_path = tmp_path / "partitionclass_partition_domain_long.csv"
+    file_path.write_text(
+        "Date,partitionclass,lookback\n"
+        "1971-12-31,1.0,21\n"
+        "1972-01-03,2.0,21\n"
+        "1973-01-02,3.0,21\n"
+    )
+    assert seeder.scan_years(file_path, chunk_size=2) == {1971, 1972, 1973}
+    since = datetime.datetime(1971, 12, 31)
+    assert seeder.scan_years(file_path, since, chunk_size=2) == {1972, 1973}
+
+    job = (file_path, *seeder.parse_filename(file_path.name), since)
+
+    def exists(name: str) -> bool:
+        return db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None
+
+    # A reader holding mri_asset_outputs makes the DDL give up instead of queueing
+    monkeypatch.setattr(partitions, "PARTITION_LOCK_TIMEOUT", "100ms")
+    db.execute(text("SELECT count(*) FROM mri_asset_outputs"))
+    assert seeder.create_partitions([job]) == []
+    assert not exists("mri_asset_outputs_y1973")
+
+    # End the reading transaction, create_partitions locks the table from its own session
+    db.rollback()
+    seeder.create_partitions([job])
+    # Committed by create_partitions itself, visible to other sessions
+    assert exists("mri_asset_outputs_y1972") and exists("mri_asset_outputs_y1973")
+    assert not exists("mri_asset_outputs_y1971")
+    db.rollback()
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from app.timeseries import closed_runs, epoch_seconds, lttb, rolling_analytics
+
+
+def reference_lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> list[int]:
+    n = len(x)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = [0]
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 1 < n_out - 2:
+            next_x = x[edges[i + 1]:edges[i + 2]].mean()
+            next_y = y[edges[i + 1]:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((x[a] - next_x) * (y[j] - y[a]) - (x[a] - x[j]) * (next_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+def test_lttb_matches_reference() -> None:
+    rng = np.random.default_rng(0)
+    x = np.arange(5000, dtype=np.float64) * 86400
+    y = np.cumsum(rng.normal(size=5000))
+    selected = lttb(x, y, 100)
+    assert len(selected) == 100
+    assert selected.tolist() == reference_lttb(x, y, 100)
+
+
+def test_lttb_keeps_endpoints_and_peaks() -> None:
+    x = np.arange(1000, dtype=np.float64)
+    y = np.zeros(1000)
+    y[500] = 10.0
+    selected = lttb(x, y, 10)
+    assert selected[0] == 0
+    assert selected[-1] == 999
+    assert 500 in selected
+    assert np.all(np.diff(selected) > 0)
+
+
+def test_lttb_returns_everything_when_small() -> None:
+    x = np.arange(5, dtype=np.float64)
+    assert lttb(x, x, 10).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_rolling_analytics_matches_loops() -> None:
+    rng = np.random.default_rng(0)
+    y = np.cumsum(rng.normal(size=300))
+    columns = rolling_analytics(y, [5, 21], [5, 50, 95])
+
+    peak = -np.inf
+    for i, value in enumerate(y):
+        peak = max(peak, value)
+        assert columns["drawdown"][i] == value - peak
+    for window in (5, 21):
+        for i in range(len(y)):
+            if i < window - 1:
+                assert np.isnan(columns[f"mean_{window}"][i])
+                assert np.isnan(columns[f"p50_{window}"][i])
+                continue
+            values = y[i - window + 1:i + 1]
+            assert np.isclose(columns[f"mean_{window}"][i], values.mean())
+            assert np.isclose(columns[f"p5_{window}"][i], np.percentile(values, 5))
+            assert np.isclose(columns[f"p95_{window}"][i], np.percentile(values, 95))
+            if i < window:
+                assert np.isnan(columns[f"volatility_{window}"][i])
+            else:
+                assert np.isclose(columns[f"volatility_{window}"][i], np.diff(y[i - window:i + 1]).std(ddof=1))
+
+
+def test_rolling_analytics_far_from_zero() -> None:
+    rng = np.random.default_rng(1)
+    y = 1e6 + np.cumsum(rng.normal(scale=1e-3, size=5000))
+    columns = rolling_analytics(y, [63], [])
+    for i in range(63, len(y), 97):
+        assert columns["mean_63"][i] == pytest.approx(y[i - 62:i + 1].mean(), abs=1e-9)
+        assert columns["volatility_63"][i] == pytest.approx(np.diff(y[i - 63:i + 1]).std(ddof=1), rel=1e-6)
+
+
+def test_rolling_analytics_shorter_than_window() -> None:
+    columns = rolling_analytics(np.array([1.0, 3.0, 2.0]), [5], [50])
+    assert columns["drawdown"].tolist() == [0.0, 0.0, -1.0]
+    assert np.isnan(columns["mean_5"]).all()
+    assert np.isnan(columns["p50_5"]).all()
+    assert rolling_analytics(np.empty(0), [5], [50])["drawdown"].tolist() == []
+
+
+def test_closed_runs() -> None:
+    starts, ends = closed_runs(np.array([True, True, False, False, True, False, True, True]))
+    assert starts.tolist() == [0, 4]
+    assert ends.tolist() == [2, 5]
+    starts, ends = closed_runs(np.array([], dtype=bool))
+    assert starts.tolist() == ends.tolist() == []
+
+
+@pytest.mark.usefixtures("local_time_zone")
+def test_epoch_seconds_ignores_local_time_zone() -> None:
+    assert epoch_seconds(datetime(1970, 1, 2)) == 86400.0
+    assert epoch_seconds(datetime(2001, 1, 2, 12)) == 978436800.0
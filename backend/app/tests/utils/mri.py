@@ -0,0 +1,19 @@
+from datetime import date as date_
+from datetime import datetime
+
+from sqlmodel import Session
+
+from app import crud_mri
+from app.models_mri import MRIAssetOutput
+
+
+def asset_output(
+    db: Session, *, date: date_ | datetime, domain: str, asset_class: str, rpr: float, lookback: int
+) -> MRIAssetOutput:
+    """
+    Unsaved output row for an (asset_class, domain) pair, creating its catalog entry if needed.
+    """
+    asset = crud_mri.get_or_create_asset(session=db, asset_class=asset_class, domain=domain)
+    if isinstance(date, datetime):
+        date = date.date()
+    return MRIAssetOutput(asset_id=asset.id, date=date, rpr=rpr, lookback=lookback)
@@ -0,0 +1,120 @@
+from collections.abc import Sequence
+from datetime import datetime, timezone
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def epoch_seconds(value: datetime) -> float:
+    """
+    Seconds since the epoch of a naive UTC datetime. Every time series
+    payload uses these, the same as extract(epoch FROM ...) in SQL, whatever
+    the server's local time zone.
+    """
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Returns the indices of the `n_out` points of (x, y) that best preserve the
+    visual shape of the series. The first and last points are always kept;
+    the points in between are split into `n_out - 2` buckets and from each
+    bucket the point forming the largest triangle with the previously kept
+    point and the average of the next bucket is selected.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Bucket boundaries over the inner points [1, n - 1)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Average point of every bucket, used as the third triangle vertex
+    x_sums = np.add.reduceat(x[1:n - 1], starts - 1)
+    y_sums = np.add.reduceat(y[1:n - 1], starts - 1)
+    counts = ends - starts
+    avg_x = np.append(x_sums / counts, x[-1])
+    avg_y = np.append(y_sums / counts, y[-1])
+
+    selected = np.empty(n_out, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i, (start, end) in enumerate(zip(starts, ends, strict=True)):
+        # Twice the triangle area for every candidate in the bucket at once
+        areas = np.abs(
+            (x[a] - avg_x[i + 1]) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y[i + 1] - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def _rolling_moments(values: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Mean and sample standard deviation of every full window of `values`,
+    from running sums of x and x² so each window costs the same whatever its
+    width. The sums are taken around the overall mean to keep them small.
+    """
+    offset = values.mean()
+    centered = values - offset
+    sums = np.concatenate(([0.0], np.cumsum(centered)))
+    squares = np.concatenate(([0.0], np.cumsum(centered * centered)))
+    total = sums[window:] - sums[:-window]
+    mean = total / window
+    variance = (squares[window:] - squares[:-window] - total * mean) / (window - 1)
+    return mean + offset, np.sqrt(np.maximum(variance, 0.0))
+
+
+def rolling_analytics(
+    values: np.ndarray, windows: Sequence[int], percentiles: Sequence[float]
+) -> dict[str, np.ndarray]:
+    """
+    Drawdown and rolling statistics of a series, one column per statistic.
+
+    `drawdown` is the distance to the running maximum. For every window,
+    `mean_<w>` is the rolling mean, `volatility_<w>` the standard deviation
+    of the last `w` changes and `p<q>_<w>` the rolling `q`-th percentile.
+    Rolling values belong to the last point of their window and are NaN
+    until the window is full. Means and volatilities come from running sums,
+    percentiles from one strided view of the series per window.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    columns = {"drawdown": values - np.maximum.accumulate(values) if n else values.copy()}
+    changes = np.diff(values)
+    for window in windows:
+        mean = np.full(n, np.nan)
+        volatility = np.full(n, np.nan)
+        bands = np.full((len(percentiles), n), np.nan)
+        if n >= window:
+            mean[window - 1:] = _rolling_moments(values, window)[0]
+            if percentiles:
+                bands[:, window - 1:] = np.percentile(sliding_window_view(values, window), percentiles, axis=1)
+        if n > window:
+            # The first full window of changes ends at the window-th point
+            volatility[window:] = _rolling_moments(changes, window)[1]
+        columns[f"mean_{window}"] = mean
+        columns[f"volatility_{window}"] = volatility
+        for percentile, band in zip(percentiles, bands, strict=True):
+            columns[f"p{percentile:g}_{window}"] = band
+    return columns
+
+
+def closed_runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Start and end (exclusive) indices of the runs of True in `mask`, found
+    from the edges of the mask. A run still open at the last element has no
+    end and is left out.
+    """
+    edges = np.diff(np.asarray(mask, dtype=np.int8), prepend=np.int8(0))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return starts[:len(ends)], ends
@@ -0,0 +1,95 @@
+"""
+Compare CRR portfolio read latency: one security lookup and two latest
+price queries per constituent vs the `crr_latest_prices` join of
+`get_portfolio`.
+
+Synthetic securities and prices are generated inside a transaction that
+is rolled back at the end, so the target database is left untouched.
+
+    python scripts/benchmark_crr_portfolio.py --securities 200 --days 5000
+"""
+import argparse
+import time
+import uuid
+
+from sqlmodel import Session, select, text
+
+from app.api.routes.crr import portfolio_statement
+from app.core.db import engine
+from app.core.partitions import ensure_partitions
+from app.models_crr import CDSPrice, CRRPortfolioConstituent, CRRPrice, CRRSecurity
+
+TICKER_PREFIX = "benchmark_crr_portfolio"
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), sum(timings) / len(timings)
+
+
+def per_constituent(session, user_id):
+    def latest_price(model, security_id):
+        latest_entry = session.exec(
+            select(model).where(model.security_id == security_id).order_by(model.entry_date.desc())
+        ).first()
+        return latest_entry.price if latest_entry else None
+
+    rows = []
+    for constituent in session.exec(
+        select(CRRPortfolioConstituent).where(CRRPortfolioConstituent.user_id == user_id)
+    ).all():
+        ticker = session.get(CRRSecurity, constituent.security_id).ticker_bbg
+        rows.append((ticker, latest_price(CDSPrice, constituent.security_id),
+                     latest_price(CRRPrice, constituent.security_id)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--securities", type=int, default=200)
+    parser.add_argument("--days", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    user_id = uuid.uuid4()
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        session = Session(bind=connection)
+        try:
+            ensure_partitions(session, years=range(2000, 2000 + args.days // 365 + 2))
+            session.execute(text("""
+                INSERT INTO crr_securities (id, ticker_bbg)
+                SELECT gen_random_uuid(), :prefix || s FROM generate_series(0, :securities - 1) s
+            """), {"securities": args.securities, "prefix": TICKER_PREFIX})
+            for table in ("cds_prices", "crr_prices"):
+                session.execute(text(f"""
+                    INSERT INTO {table} (id, security_id, entry_date, price)
+                    SELECT gen_random_uuid(), securities.id, TIMESTAMP '2000-01-01' + d * INTERVAL '1 day', random()
+                    FROM crr_securities securities, generate_series(0, :days - 1) d
+                    WHERE securities.ticker_bbg LIKE :prefix || '%'
+                """), {"days": args.days, "prefix": TICKER_PREFIX})
+                session.execute(text(f"ANALYZE {table}"))
+            session.execute(text("""
+                INSERT INTO crr_portfolio_constituents (id, user_id, security_id, sensitivity)
+                SELECT gen_random_uuid(), :user_id, securities.id, 1.0
+                FROM crr_securities securities WHERE securities.ticker_bbg LIKE :prefix || '%'
+            """), {"user_id": user_id, "prefix": TICKER_PREFIX})
+
+            old = timed(lambda: per_constituent(session, user_id), args.repeat)
+            new = timed(lambda: session.exec(portfolio_statement(user_id)).all(), args.repeat)
+
+            print(f"securities:            {args.securities:,}")
+            print(f"price rows:            {2 * args.securities * args.days:,}")
+            print(f"per constituent:       {old[0] * 1000:9.1f} ms min, {old[1] * 1000:9.1f} ms mean")
+            print(f"snapshot join:         {new[0] * 1000:9.1f} ms min, {new[1] * 1000:9.1f} ms mean")
+        finally:
+            session.close()
+            transaction.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Compare MRI portfolio read latency: on-the-fly aggregation vs the
+materialized `mri_portfolio_series` table vs the memory-mapped asset
+output matrix.
+
+Synthetic asset outputs are generated inside a transaction that is rolled
+back at the end, so the target database is left untouched.
+
+    python scripts/benchmark_mri_series.py --assets 50 --days 20000 --lookbacks 2
+"""
+import argparse
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from sqlmodel import Session, select, text
+
+from app import crud_mri
+from app.mri_matrix import AssetOutputMatrix, write_snapshot
+from app.core.db import engine
+from app.models_mri import MRIPortfolio, MRIPortfolioConstituent, MRIPortfolioSeries
+
+DOMAIN = "benchmark_mri_series"
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), sum(timings) / len(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assets", type=int, default=50)
+    parser.add_argument("--days", type=int, default=20000)
+    parser.add_argument("--lookbacks", type=int, default=2)
+    parser.add_argument("--constituents", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        session = Session(bind=connection)
+        try:
+            session.execute(text("""
+                INSERT INTO mri_assets (asset_class, domain)
+                SELECT 'class_' || a, :domain FROM generate_series(0, :assets - 1) a
+            """), {"assets": args.assets, "domain": DOMAIN})
+            session.execute(text("""
+                INSERT INTO mri_asset_outputs (asset_id, lookback, date, rpr)
+                SELECT assets.id, 21 * (l + 1), DATE '1950-01-01' + d, random()
+                FROM mri_assets assets,
+                     generate_series(0, :days - 1) d,
+                     generate_series(0, :lookbacks - 1) l
+                WHERE assets.domain = :domain
+            """), {"days": args.days, "lookbacks": args.lookbacks, "domain": DOMAIN})
+            session.execute(text("ANALYZE mri_asset_outputs"))
+            rows = args.days * args.assets * args.lookbacks
+
+            portfolio = MRIPortfolio(name="benchmark", user_id=uuid.uuid4())
+            session.add(portfolio)
+            session.flush()
+            session.add_all([
+                MRIPortfolioConstituent(portfolio_id=portfolio.id, asset_name=f"class_{i}", asset_domain=DOMAIN,
+                                        asset_class=f"class_{i}", weight=1 / args.constituents)
+                for i in range(args.constituents)
+            ])
+            session.flush()
+
+            start = time.perf_counter()
+            crud_mri.rebuild_portfolio_series(session=session, portfolio_ids=[portfolio.id])
+            rebuild = time.perf_counter() - start
+            session.execute(text("ANALYZE mri_portfolio_series"))
+
+            aggregate = crud_mri.portfolio_series_statement(portfolio_ids=[portfolio.id], lookback=21).order_by(
+                text("date")
+            )
+            materialized = (
+                select(MRIPortfolioSeries.date, MRIPortfolioSeries.value)
+                .where(MRIPortfolioSeries.portfolio_id == portfolio.id, MRIPortfolioSeries.lookback == 21)
+                .order_by(MRIPortfolioSeries.date)
+            )
+            old = timed(lambda: session.execute(aggregate).all(), args.repeat)
+            new = timed(lambda: session.execute(materialized).all(), args.repeat)
+
+            with tempfile.TemporaryDirectory() as snapshot_dir:
+                start = time.perf_counter()
+                write_snapshot(session=session, directory=Path(snapshot_dir), dataset_version=0)
+                snapshot = time.perf_counter() - start
+                matrix = AssetOutputMatrix.load(Path(snapshot_dir))
+                weights = [(f"class_{i}", DOMAIN, 1 / args.constituents) for i in range(args.constituents)]
+                dense = timed(lambda: matrix.series(weights, 21), args.repeat)
+
+            print(f"asset output rows:     {rows:,}")
+            print(f"series rebuild:        {rebuild * 1000:9.1f} ms")
+            print(f"aggregate read:        {old[0] * 1000:9.1f} ms min, {old[1] * 1000:9.1f} ms mean")
+            print(f"materialized read:     {new[0] * 1000:9.1f} ms min, {new[1] * 1000:9.1f} ms mean")
+            print(f"matrix snapshot:       {snapshot * 1000:9.1f} ms")
+            print(f"matrix read:           {dense[0] * 1000:9.1f} ms min, {dense[1] * 1000:9.1f} ms mean")
+        finally:
+            session.close()
+            transaction.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Measure seeder throughput for different `--workers` counts.
+
+Synthetic asset output CSVs are written to a temporary directory and
+loaded once per worker count, each time inside a transaction that is
+rolled back, so the target database is left untouched.
+
+    python scripts/benchmark_seeder.py --files 32 --days 20000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sqlmodel import Session
+
+import seeder  # Next to this script, importable by name so worker processes can unpickle its functions
+from app.core.db import engine
+
+
+def write_files(directory, files, days):
+    dates = pd.date_range("1950-01-01", periods=days, freq="D").strftime("%Y-%m-%d")
+    paths = []
+    for i in range(files):
+        path = os.path.join(directory, f"bench{i}_bench_long.csv")
+        pd.DataFrame({
+            "Date": np.tile(dates, 2),
+            f"bench{i}": np.random.rand(2 * days),
+            "lookback": np.repeat([21, 63], days),
+        }).to_csv(path, index=False)
+        paths.append((path, *seeder.parse_filename(os.path.basename(path)), None))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=32)
+    parser.add_argument("--days", type=int, default=20000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_files(directory, args.files, args.days)
+        rows = args.files * args.days * 2
+        print(f"{args.files} files, {rows:,} rows, {os.cpu_count()} cores")
+
+        baseline = None
+        for workers in args.workers:
+            # Parsing alone, the part that is spread over the pool
+            start = time.perf_counter()
+            if workers <= 1:
+                for job in files:
+                    for _ in seeder.parse_chunks(*job):
+                        pass
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    for _ in pool.map(seeder.parse_range, *zip(*seeder.chunk_jobs(files))):
+                        pass
+            parsing = time.perf_counter() - start
+
+            with engine.connect() as connection:
+                transaction = connection.begin()
+                session = Session(bind=connection)
+                try:
+                    seeder.create_staging_table(session)
+                    start = time.perf_counter()
+                    for _ in seeder.load_files(session, files, workers):
+                        pass
+                    elapsed = time.perf_counter() - start
+                finally:
+                    session.close()
+                    transaction.rollback()
+            baseline = baseline or elapsed
+            print(f"workers={workers:<3} parse {parsing:7.2f} s  load {elapsed:7.2f} s  "
+                  f"{rows / elapsed:12,.0f} rows/s  {baseline / elapsed:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Compare the spread region detection of `calculate_spread_analysis`: the
+former DataFrames built from one dict per row plus an `iterrows` walk vs
+column arrays and a run-length encoding of the threshold masks.
+
+Runs on synthetic in-memory price histories, no database is needed.
+
+    python scripts/benchmark_spread_analysis.py --years 20 --days 21 --deviation 1
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from app.api.routes.crr import spread_analysis
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings), sum(timings) / len(timings)
+
+
+def row_loop(cds_rows, crr_rows, days, deviation):
+    cds_data = pd.DataFrame([dict(row) for row in cds_rows]).rename(columns={"price": "cds_price", "entry_date": "date"})
+    crr_data = pd.DataFrame([dict(row) for row in crr_rows]).rename(columns={"price": "crr_price", "entry_date": "date"})
+    df = pd.merge(cds_data, crr_data, on="date", how="inner")
+    df["spread"] = df["cds_price"] - df["crr_price"]
+    df["rolling"] = df["spread"].rolling(window=days).mean().fillna(0)
+    std_dev = df["rolling"].std() * deviation
+
+    regions = []
+    first_green, first_red = None, None
+    for _, row in df.iterrows():
+        if row["rolling"] > std_dev:
+            if first_green is None:
+                first_green = row["date"]
+        elif first_green:
+            regions.append(("positive", first_green, row["date"] - timedelta(days=1)))
+            first_green = None
+
+        if row["rolling"] < -std_dev:
+            if first_red is None:
+                first_red = row["date"]
+        elif first_red:
+            regions.append(("negative", first_red, row["date"] - timedelta(days=1)))
+            first_red = None
+    return regions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--days", type=int, default=21)
+    parser.add_argument("--deviation", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    count = args.years * 365
+    dates = [datetime(2000, 1, 1) + timedelta(days=day) for day in range(count)]
+    epochs = np.array([date.timestamp() for date in dates]) - datetime(1970, 1, 1).timestamp()
+    crr_prices = 100 + np.cumsum(rng.normal(size=count))
+    cds_prices = crr_prices + np.cumsum(rng.normal(scale=0.5, size=count))
+    security_id = uuid.uuid4()
+    # What the ORM objects' .dict() used to produce
+    cds_rows = [{"id": uuid.uuid4(), "security_id": security_id, "entry_date": date, "price": price}
+                for date, price in zip(dates, cds_prices.tolist(), strict=True)]
+    crr_rows = [{"id": uuid.uuid4(), "security_id": security_id, "entry_date": date, "price": price}
+                for date, price in zip(dates, crr_prices.tolist(), strict=True)]
+    cds = np.column_stack([epochs, cds_prices])
+    crr = np.column_stack([epochs, crr_prices])
+
+    old, old_min, old_mean = timed(lambda: row_loop(cds_rows, crr_rows, args.days, args.deviation), args.repeat)
+    # The endpoint's own code, as run on the columns it reads from the database
+    new, new_min, new_mean = timed(lambda: spread_analysis(cds, crr, args.days, args.deviation).regions, args.repeat)
+    assert [(region.spread, region.x1, region.x2) for region in new] == old
+
+    print(f"dates:                 {count:,}")
+    print(f"regions:               {len(new):,}")
+    print(f"row loop:              {old_min * 1000:9.1f} ms min, {old_mean * 1000:9.1f} ms mean")
+    print(f"vectorized:            {new_min * 1000:9.1f} ms min, {new_mean * 1000:9.1f} ms mean")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Print row count, heap, index and total size of tables, e.g. before and
+after a schema migration.
+
+    python scripts/report_table_sizes.py mri_asset_outputs mri_assets
+"""
+import argparse
+
+from sqlmodel import Session, text
+
+from app.core.db import engine
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("tables", nargs="+")
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        print(f"{'table':<28} {'rows':>12} {'table':>10} {'indexes':>10} {'total':>10} {'bytes/row':>10}")
+        for table in args.tables:
+            if session.execute(text("SELECT to_regclass(:table)"), {"table": table}).scalar() is None:
+                print(f"{table:<28} {'missing':>12}")
+                continue
+            rows = session.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+            heap, indexes, total, pretty_heap, pretty_indexes, pretty_total = session.execute(text("""
+                SELECT pg_table_size(:table), pg_indexes_size(:table), pg_total_relation_size(:table),
+                       pg_size_pretty(pg_table_size(:table)), pg_size_pretty(pg_indexes_size(:table)),
+                       pg_size_pretty(pg_total_relation_size(:table))
+            """), {"table": table}).one()
+            per_row = f"{total / rows:.1f}" if rows else "-"
+            print(f"{table:<28} {rows:>12,} {pretty_heap:>10} {pretty_indexes:>10} {pretty_total:>10} {per_row:>10}")
+
+
+if __name__ == "__main__":
+    main()